@@ -0,0 +1,39 @@
+import timeit
+
+import numpy as np
+
+from framebuffer import FrameBuffer
+from scene import load_instanced_scene
+
+
+def project_edges(scene, position, focal_length=500):
+    # Krawedzie sceny rzutowane kamera patrzaca wzdluz +z - bez Tk, jak CameraApp.project_points
+    everything = np.arange(len(scene.offsets))
+    rotated = scene.instance_points(everything) - position
+    z = rotated[:, 2]
+    screen = np.column_stack((400 + rotated[:, 0] / np.maximum(z, 1e-9) * focal_length,
+                              300 - rotated[:, 1] / np.maximum(z, 1e-9) * focal_length))
+    edges = scene.edges_of_instances(len(everything))
+    edges = edges[(z[edges] > 0).all(axis=1)]
+    return screen[edges].reshape(-1, 4)
+
+
+def benchmark(name, lines, repeat=5):
+    frame = FrameBuffer()
+    print(f"{name}: {len(lines)} linii")
+    for antialias in (False, True):
+        def run():
+            frame.clear()
+            frame.draw_lines(lines, antialias=antialias)
+        seconds = min(timeit.repeat(run, number=1, repeat=repeat))
+        print(f"  {'wygladzane' if antialias else 'DDA':>10}: {seconds * 1000:8.2f} ms")
+    return frame
+
+
+if __name__ == "__main__":
+    scene = load_instanced_scene('cube_instances')
+    frame = benchmark("scena", project_edges(scene, np.array([3.0, 3.0, -10.0])))
+    # Klatka zapisana bez okna - ostatnia rysowana wersja (wygladzana)
+    frame.save('benchmark_lines.ppm')
+    rng = np.random.default_rng(0)
+    benchmark("losowe", rng.uniform(-100, 900, (20000, 4)))
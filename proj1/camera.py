@@ -1,26 +1,40 @@
-import json
+import time
 import tkinter as tk
 
 import numpy as np
 
+from canvas_pool import CanvasItemPool
+from culling import frustum_planes
+from framebuffer import CanvasImage, FrameBuffer
+from lod import FULL, POINT, SILHOUETTE, select_lod, unique_pixels
+from scene import load_instanced_scene
+from spatial_index import BVH
+
+# Po ilu ms KeyRelease bez KeyPress tego samego klawisza klawisz uznawany jest za puszczony
+RELEASE_DELAY_MS = 30
+
 
 class CameraApp:
-    def __init__(self, root):
+    def __init__(self, root, target_fps=60):
         self.root = root
         self.canvas = tk.Canvas(root, width=800, height=600)
         self.canvas.pack()
 
         # config kamery
         self.position = np.array([3.0, 3.0, -10.0])
-        self.move_speed = 0.5
-        self.rotation_speed = 0.05
+        self.move_speed = 5.0  # jednostki na sekunde
+        self.rotation_speed = 1.0  # radiany na sekunde
+        self.zoom_speed = 2.0  # mnoznik ogniskowej na sekunde
         self.focal_length = 500
         self.rotation_matrix = np.identity(3)
 
-        # wczytaj obiekty
-        with open('cube_data.json') as f:
-            data = json.load(f)
-        self.cube_data = [(tuple(p1), tuple(p2)) for p1, p2 in data]
+        # wczytaj obiekty - szescian-szablon i przesuniecia kopii, rzutowane naraz w redraw
+        self.scene = load_instanced_scene('cube_instances')
+        # indeks przestrzenny szescianow - budowany raz, uzywany co klatke do odrzucania
+        self.cube_index = BVH(self.scene.cube_bounds)
+        self._rotated = np.empty((0, 3))
+        self._screen = np.empty((0, 2))
+        self._visible = np.empty(0, dtype=bool)
 
         grid_center = np.array([4.0, 4.0, 4.0])
         direction = grid_center - self.position
@@ -38,23 +52,118 @@ class CameraApp:
         ])
         self.rotation_matrix = self.rotation_matrix @ yaw_180
 
-        self.root.bind('<w>', lambda e: self.move_forward())
-        self.root.bind('<s>', lambda e: self.move_backward())
-        self.root.bind('<a>', lambda e: self.move_left())
-        self.root.bind('<d>', lambda e: self.move_right())
-        self.root.bind('<Up>', lambda e: self.look_up())
-        self.root.bind('<Down>', lambda e: self.look_down())
-        self.root.bind('<Left>', lambda e: self.turn_left())
-        self.root.bind('<Right>', lambda e: self.turn_right())
-        self.root.bind('<q>', lambda e: self.move_up())
-        self.root.bind('<e>', lambda e: self.move_down())
-        self.root.bind('<f>', lambda e: self.roll_clockwise())
-        self.root.bind('<g>', lambda e: self.roll_counter_clockwise())
-        self.root.bind('<h>', lambda e: self.zoom_in())
-        self.root.bind('<j>', lambda e: self.zoom_out())
+        # klawisz -> akcja wykonywana co klatke, dopoki klawisz jest wcisniety
+        self.key_actions = {
+            'w': self.move_forward,
+            's': self.move_backward,
+            'a': self.move_left,
+            'd': self.move_right,
+            'up': self.look_up,
+            'down': self.look_down,
+            'left': self.turn_left,
+            'right': self.turn_right,
+            'q': self.move_up,
+            'e': self.move_down,
+            'f': self.roll_clockwise,
+            'g': self.roll_counter_clockwise,
+            'h': self.zoom_in,
+            'j': self.zoom_out,
+        }
+        # klawisz -> akcja wykonywana raz na wcisniecie
+        self.key_toggles = {
+            'p': self.toggle_blit,
+            'c': self.capture,
+            'l': self.toggle_antialias,
+            'o': self.toggle_lod,
+        }
+        self.pressed_keys = set()
+        # klawisz -> zaplanowane puszczenie (after); autorepeat X11 to pary KeyRelease + KeyPress,
+        # wiec puszczenie czeka chwile i KeyPress tego samego klawisza je odwoluje
+        self.pending_releases = {}
+        self.root.bind('<KeyPress>', self.on_key_press)
+        self.root.bind('<KeyRelease>', self.on_key_release)
+        self.root.bind('<FocusOut>', self.on_focus_out)
+
+        # petla klatek - zmiany z klawiszy zbierane i rysowane najwyzej raz na klatke
+        self.frame_interval = 1.0 / target_fps
+        self.dirty = True
+        self.last_tick = time.perf_counter()
+
+        # elementy canvasa tworzone raz i przesuwane w kolejnych klatkach
+        self.edge_pool = CanvasItemPool(self.canvas, 'line', 'scene', fill='black')
+
+        # P - linie rasteryzowane do bufora klatki i pokazane jednym obrazem zamiast elementu na linie
+        self.use_blit = False
+        # L - wygladzane linie w obrazie (i w zapisanych klatkach)
+        self.antialias = False
+        # O - dalekie szesciany jako kontur albo punkt (poziom szczegolowosci wg rozmiaru na ekranie)
+        self.use_lod = True
+        self.captured = 0
+        self.frame = FrameBuffer(800, 600)
+        self.frame_image = CanvasImage(self.canvas, 800, 600, 'scene')
 
         self.draw_controls()
         self.redraw()
+        self.dirty = False
+        self.root.after(int(self.frame_interval * 1000), self.tick)
+
+    def toggle_blit(self):
+        self.use_blit = not self.use_blit
+        self.dirty = True
+
+    def toggle_antialias(self):
+        self.antialias = not self.antialias
+        self.dirty = True
+
+    def toggle_lod(self):
+        self.use_lod = not self.use_lod
+        self.dirty = True
+
+    def on_key_press(self, event):
+        key = event.keysym.lower()
+        pending = self.pending_releases.pop(key, None)
+        if pending is not None:
+            # KeyRelease tuz przed KeyPress - to autorepeat, klawisz caly czas wcisniety
+            self.root.after_cancel(pending)
+        # autorepeat wysyla kolejne KeyPress - akcje jednorazowe tylko przy pierwszym
+        if key in self.key_toggles and key not in self.pressed_keys:
+            self.key_toggles[key]()
+        self.pressed_keys.add(key)
+
+    def on_key_release(self, event):
+        key = event.keysym.lower()
+        if key not in self.pending_releases:
+            self.pending_releases[key] = self.root.after(RELEASE_DELAY_MS, self.release_key, key)
+
+    def release_key(self, key):
+        self.pending_releases.pop(key, None)
+        self.pressed_keys.discard(key)
+
+    def on_focus_out(self, event):
+        for pending in self.pending_releases.values():
+            self.root.after_cancel(pending)
+        self.pending_releases.clear()
+        self.pressed_keys.clear()
+
+    def tick(self):
+        now = time.perf_counter()
+        # po dlugiej przerwie (np. przeciaganie okna) nie przeskakuj kamera
+        dt = min(now - self.last_tick, 0.1)
+        self.last_tick = now
+
+        for key in self.pressed_keys:
+            action = self.key_actions.get(key)
+            if action:
+                action(dt)
+
+        # wszystkie zmiany z tej klatki - jedno przerysowanie, a bez zmian zadnego
+        if self.dirty:
+            self.redraw()
+            self.dirty = False
+
+        elapsed = time.perf_counter() - now
+        delay = max(1, int((self.frame_interval - elapsed) * 1000))
+        self.root.after(delay, self.tick)
 
     def get_view_vectors(self):
         right = self.rotation_matrix[:, 0]
@@ -62,85 +171,85 @@ class CameraApp:
         forward = -self.rotation_matrix[:, 2]
         return forward, right, up
 
-    def move_forward(self):
+    def move_forward(self, dt):
         forward, _, _ = self.get_view_vectors()
-        self.position -= forward * self.move_speed
-        self.redraw()
+        self.position -= forward * self.move_speed * dt
+        self.dirty = True
 
-    def move_backward(self):
+    def move_backward(self, dt):
         forward, _, _ = self.get_view_vectors()
-        self.position += forward * self.move_speed
-        self.redraw()
+        self.position += forward * self.move_speed * dt
+        self.dirty = True
 
-    def move_left(self):
+    def move_left(self, dt):
         _, right, _ = self.get_view_vectors()
-        self.position -= right * self.move_speed
-        self.redraw()
+        self.position -= right * self.move_speed * dt
+        self.dirty = True
 
-    def move_right(self):
+    def move_right(self, dt):
         _, right, _ = self.get_view_vectors()
-        self.position += right * self.move_speed
-        self.redraw()
+        self.position += right * self.move_speed * dt
+        self.dirty = True
 
-    def move_up(self):
+    def move_up(self, dt):
         _, _, up = self.get_view_vectors()
-        self.position += up * self.move_speed
-        self.redraw()
+        self.position += up * self.move_speed * dt
+        self.dirty = True
 
-    def move_down(self):
+    def move_down(self, dt):
         _, _, up = self.get_view_vectors()
-        self.position -= up * self.move_speed
-        self.redraw()
+        self.position -= up * self.move_speed * dt
+        self.dirty = True
 
-    def look_up(self):
-        theta = self.rotation_speed
+    def look_up(self, dt):
+        theta = self.rotation_speed * dt
         c, s = np.cos(theta), np.sin(theta)
         delta_R = np.array([[1, 0, 0], [0, c, s], [0, -s, c]])
         self.rotation_matrix = self.rotation_matrix @ delta_R
-        self.redraw()
+        self.dirty = True
 
-    def look_down(self):
-        theta = -self.rotation_speed
+    def look_down(self, dt):
+        theta = -self.rotation_speed * dt
         c, s = np.cos(theta), np.sin(theta)
         delta_R = np.array([[1, 0, 0], [0, c, s], [0, -s, c]])
         self.rotation_matrix = self.rotation_matrix @ delta_R
-        self.redraw()
+        self.dirty = True
 
-    def turn_left(self):
-        theta = self.rotation_speed
+    def turn_left(self, dt):
+        theta = self.rotation_speed * dt
         c, s = np.cos(theta), np.sin(theta)
         delta_R = np.array([[c, 0, -s], [0, 1, 0], [s, 0, c]])
         self.rotation_matrix = self.rotation_matrix @ delta_R
-        self.redraw()
+        self.dirty = True
 
-    def turn_right(self):
-        theta = -self.rotation_speed
+    def turn_right(self, dt):
+        theta = -self.rotation_speed * dt
         c, s = np.cos(theta), np.sin(theta)
         delta_R = np.array([[c, 0, -s], [0, 1, 0], [s, 0, c]])
         self.rotation_matrix = self.rotation_matrix @ delta_R
-        self.redraw()
+        self.dirty = True
 
-    def roll_clockwise(self):
-        theta = -self.rotation_speed
+    def roll_clockwise(self, dt):
+        theta = -self.rotation_speed * dt
         c, s = np.cos(theta), np.sin(theta)
         delta_R = np.array([[c, s, 0], [-s, c, 0], [0, 0, 1]])
         self.rotation_matrix = self.rotation_matrix @ delta_R
-        self.redraw()
+        self.dirty = True
 
-    def roll_counter_clockwise(self):
-        theta = self.rotation_speed
+    def roll_counter_clockwise(self, dt):
+        theta = self.rotation_speed * dt
         c, s = np.cos(theta), np.sin(theta)
         delta_R = np.array([[c, s, 0], [-s, c, 0], [0, 0, 1]])
         self.rotation_matrix = self.rotation_matrix @ delta_R
-        self.redraw()
+        self.dirty = True
 
-    def zoom_in(self):
-        self.focal_length *= 1.1
-        self.redraw()
+    def zoom_in(self, dt):
+        self.focal_length *= self.zoom_speed ** dt
+        self.dirty = True
 
-    def zoom_out(self):
-        self.focal_length /= 1.1
-        self.redraw()
+    def zoom_out(self, dt):
+        self.focal_length /= self.zoom_speed ** dt
+        self.dirty = True
 
     def project_point(self, point):
         translated = np.array(point) - self.position
@@ -152,21 +261,120 @@ class CameraApp:
         y_proj = (y / z) * self.focal_length
         return 400 + x_proj, 300 - y_proj
 
+    def project_points(self, points):
+        # Rzutowanie wielu punktow naraz: jedno mnozenie macierzy i jedno dzielenie
+        # Zwraca widoki na bufory (N,2) wspolrzednych ekranu i (N,) maske widocznosci
+        rotated = self.rotation_buffer(len(points))
+        # (R.T @ (p - pos)) dla kazdego wiersza to (p - pos) @ R
+        np.subtract(points, self.position, out=rotated)
+        np.matmul(rotated, self.rotation_matrix, out=rotated)
+        return self.perspective(len(points))
+
+    def project_instances(self, template, offsets):
+        # Kopie jednego szablonu: (t + o - pos) @ R = t @ R + (o - pos) @ R - szablon obracany raz,
+        # przesuniecia raz na kopie, a wierzcholki kopii to juz tylko dodawanie z broadcastem.
+        # Wierzcholek k kopii i ma numer i * len(template) + k
+        n = len(offsets) * len(template)
+        rotated = self.rotation_buffer(n).reshape(len(offsets), len(template), 3)
+        np.add(((offsets - self.position) @ self.rotation_matrix)[:, None, :], template @ self.rotation_matrix,
+               out=rotated)
+        return self.perspective(n)
+
+    def rotation_buffer(self, n):
+        # Bufory powiekszane tylko gdy trzeba - zwraca widok (n,3) na punkty w ukladzie kamery
+        if len(self._rotated) < n:
+            self._rotated = np.empty((n, 3))
+            self._screen = np.empty((n, 2))
+            self._visible = np.empty(n, dtype=bool)
+        return self._rotated[:n]
+
+    def perspective(self, n):
+        # Punkty z bufora _rotated (uklad kamery) na ekran
+        rotated = self._rotated[:n]
+        screen = self._screen[:n]
+        visible = self._visible[:n]
+        z = rotated[:, 2]
+        np.greater(z, 0, out=visible)  # punkty za kamera sa niewidoczne
+
+        # Punkty za kamera i tak sa odrzucane przez maske, wiec wystarczy nie dzielic przez zero
+        np.maximum(z, 1e-9, out=z)
+        np.divide(rotated[:, :2], z[:, None], out=screen)
+        screen *= self.focal_length
+        screen[:, 0] += 400
+        np.subtract(300, screen[:, 1], out=screen[:, 1])
+        return screen, visible
+
+    def cube_levels(self, cube_offsets):
+        # Poziom szczegolowosci kazdego szescianu z glebokosci jego srodka w ukladzie kamery
+        if not self.use_lod:
+            return np.full(len(cube_offsets), FULL, dtype=np.int8)
+        depth = (cube_offsets + self.scene.center - self.position) @ self.rotation_matrix[:, 2]
+        return select_lod(depth, self.scene.radius, self.focal_length)
+
+    def projected_lines(self):
+        # Odrzuc cale szesciany poza ostroslupem widzenia, zanim cokolwiek zostanie zrzutowane
+        normals, offsets = frustum_planes(self.position, self.rotation_matrix, self.focal_length)
+        cube_ids = self.cube_index.query_frustum(normals, offsets)
+        cube_offsets = self.scene.offsets[cube_ids]
+        level = self.cube_levels(cube_offsets)
+
+        # Dalekie szesciany - tylko rzut srodka, po jednym punkcie na piksel
+        # (bufory rzutowania sa wspolne, wiec najpierw punkty, potem szablony)
+        far = cube_offsets[level == POINT] + self.scene.center
+        screen, visible = self.project_points(far)
+        points = unique_pixels(screen[visible], 800, 600)
+
+        # Blizsze - wszystkie krawedzie albo, w srednim zakresie, tylko kontur
+        near = level != POINT
+        cube_offsets, level = cube_offsets[near], level[near]
+        keep = np.ones((len(cube_offsets), len(self.scene.template_edges)), dtype=bool)
+        outline = level == SILHOUETTE
+        keep[outline] = self.scene.silhouette_edges(self.scene.front_faces(cube_offsets[outline], self.position))
+        screen, visible = self.project_instances(self.scene.template_vertices, cube_offsets)
+        edges = self.scene.edges_of_instances(len(cube_offsets))[keep.ravel()]
+        drawn = visible[edges[:, 0]] & visible[edges[:, 1]]
+        # punkt jako odcinek dlugosci piksela - Tk nie rysuje linii o zerowej dlugosci
+        return np.concatenate((screen[edges[drawn]].reshape(-1, 4), np.hstack((points, points + [1, 0]))))
+
     def redraw(self):
-        self.canvas.delete("all")
-        for edge in self.cube_data:
-            p1 = self.project_point(edge[0])
-            p2 = self.project_point(edge[1])
-            if p1 and p2:
-                self.canvas.create_line(p1[0], p1[1], p2[0], p2[1], fill='black')
-        self.draw_controls()
+        lines = self.projected_lines()
+        if self.use_blit:
+            self.render_frame(lines)
+            self.frame_image.show(self.frame)
+            self.edge_pool.hide()
+            return
+        self.frame_image.hide()
+        if self.edge_pool.update(lines.tolist()):
+            # nowe linie laduja na wierzchu stosu - tekst musi zostac nad nimi
+            self.canvas.tag_raise('hud')
+
+    def render_frame(self, lines=None):
+        # Biezacy widok do self.frame - ten sam bufor sluzy do wyswietlenia i do zapisu klatki
+        if lines is None:
+            lines = self.projected_lines()
+        self.frame.clear()
+        self.frame.draw_lines(lines, antialias=self.antialias)
+
+    def capture(self, path=None):
+        # Zapisz biezacy widok do pliku PPM - niezaleznie od trybu wyswietlania
+        if path is None:
+            path = f'frame_{self.captured:04d}.ppm'
+            self.captured += 1
+        self.render_frame()
+        self.frame.save(path)
+        return path
 
     def draw_controls(self):
+        # Tekst jest statyczny - rysowany tylko raz
         controls = """Controls:
         W/S - Move forward/backward
         A/D - Strafe left/right
         Q/E - Move up/down
         F/G - Roll clockwise/counter
         Arrows - Look around
-        H/J - Zoom in/out"""
-        self.canvas.create_text(10, 10, text=controls, anchor='nw', fill='black')
+        H/J - Zoom in/out
+        P - Toggle image output
+        C - Save frame (PPM)
+        L - Toggle anti-aliasing
+        O - Toggle level of detail"""
+        self.canvas.create_text(10, 10, text=controls, anchor='nw', fill='black', tags='hud')
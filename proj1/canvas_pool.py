@@ -0,0 +1,46 @@
+class CanvasItemPool:
+    # Pula elementow canvasa jednego typu (linie albo wielokaty) dla rysowania w trybie retained.
+    # Zamiast delete("all") i tworzenia wszystkiego od nowa istniejace elementy sa przesuwane przez
+    # coords, a nadmiarowe ukrywane. Kolejnosc elementow w puli = kolejnosc rysowania (stos Tk).
+    def __init__(self, canvas, kind, tag, **options):
+        self.canvas = canvas
+        self.kind = kind  # 'line' albo 'polygon'
+        self.tag = tag
+        self.options = options
+        self.items = []
+        self.coords = []  # ostatnio ustawione wspolrzedne kazdego elementu
+        self.shown = 0  # ile elementow jest aktualnie widocznych
+
+    def _create(self, coords):
+        options = dict(self.options, tags=self.tag)
+        if self.kind == 'line':
+            return self.canvas.create_line(*coords, **options)
+        return self.canvas.create_polygon(*coords, **options)
+
+    def update(self, coords_list):
+        # coords_list - lista plaskich list wspolrzednych [x1, y1, x2, y2, ...]
+        canvas = self.canvas
+        created = False
+        for i, coords in enumerate(coords_list):
+            if i >= len(self.items):
+                self.items.append(self._create(coords))
+                self.coords.append(coords)
+                created = True
+                continue
+
+            item = self.items[i]
+            # Tk dostaje tylko to, co sie faktycznie zmienilo
+            if self.coords[i] != coords:
+                canvas.coords(item, coords)
+                self.coords[i] = coords
+            if i >= self.shown:
+                canvas.itemconfigure(item, state='normal')
+
+        # Nadmiarowe elementy ukryj zamiast usuwac - przydadza sie w nastepnej klatce
+        for item in self.items[len(coords_list):self.shown]:
+            canvas.itemconfigure(item, state='hidden')
+        self.shown = len(coords_list)
+        return created
+
+    def hide(self):
+        self.update([])
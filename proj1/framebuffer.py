@@ -0,0 +1,122 @@
+import tkinter as tk
+
+import numpy as np
+
+
+def clip_lines(lines, width, height):
+    # Przytnij odcinki (L,4) do prostokata ekranu (Liang-Barsky, wszystkie naraz);
+    # odcinki w calosci poza ekranem odpadaja
+    x1, y1, x2, y2 = lines.T
+    dx, dy = x2 - x1, y2 - y1
+    enter = np.zeros(len(lines))
+    leave = np.ones(len(lines))
+    outside = np.zeros(len(lines), dtype=bool)
+    for p, q in ((-dx, x1), (dx, width - 1 - x1), (-dy, y1), (dy, height - 1 - y1)):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = q / p
+        outside |= (p == 0) & (q < 0)
+        enter = np.where(p < 0, np.maximum(enter, r), enter)
+        leave = np.where(p > 0, np.minimum(leave, r), leave)
+    keep = ~outside & (enter <= leave)
+    enter, leave = enter[keep], leave[keep]
+    x1, y1, dx, dy = x1[keep], y1[keep], dx[keep], dy[keep]
+    return np.stack((x1 + enter * dx, y1 + enter * dy, x1 + leave * dx, y1 + leave * dy), axis=1)
+
+
+class FrameBuffer:
+    # Klatka jako tablica RGB (H,W,3) rysowana numpy - pokazywana w Tk jako jeden obraz
+    # (CanvasImage) albo zapisywana do pliku, takze bez okna
+    def __init__(self, width=800, height=600, background=(255, 255, 255)):
+        self.width = width
+        self.height = height
+        self.background = np.array(background, dtype=np.uint8)
+        self.color = np.empty((height, width, 3), dtype=np.uint8)
+        self.clear()
+
+    def clear(self):
+        self.color[:] = self.background
+
+    def draw_lines(self, lines, color=(0, 0, 0), antialias=False):
+        # Odcinki (L,4) jako x1, y1, x2, y2 - wszystkie naraz (DDA): kazdy odcinek dostaje
+        # tyle probek, ile pikseli ma wzdluz dluzszej osi
+        lines = clip_lines(np.asarray(lines, dtype=float).reshape(-1, 4), self.width, self.height)
+        if not len(lines):
+            return
+        if antialias:
+            self.draw_smooth_lines(lines, color)
+            return
+        delta = lines[:, 2:] - lines[:, :2]
+        steps = np.ceil(np.abs(delta).max(axis=1)).astype(np.int64) + 1
+        owners = np.repeat(np.arange(len(lines)), steps)
+        local = np.arange(len(owners)) - np.repeat(np.cumsum(steps) - steps, steps)
+        t = local / np.maximum(steps - 1, 1)[owners]
+        points = np.rint(lines[owners, :2] + t[:, None] * delta[owners]).astype(np.int64)
+        self.color[points[:, 1], points[:, 0]] = color
+
+    def draw_smooth_lines(self, lines, color):
+        # Wygladzanie jak u Xiaolin Wu: w kazdym kroku wzdluz dluzszej osi dwa piksele sasiadujace
+        # w krotszej osi, z kryciem wg odleglosci od idealnej linii. Krycie pikseli z wielu linii
+        # laczone maksimum, potem jedno mieszanie z tlem
+        x1, y1, x2, y2 = lines.T
+        steep = np.abs(y2 - y1) > np.abs(x2 - x1)
+        # u - dluzsza os, v - krotsza; odcinki skierowane tak, zeby u roslo
+        u1, v1 = np.where(steep, y1, x1), np.where(steep, x1, y1)
+        u2, v2 = np.where(steep, y2, x2), np.where(steep, x2, y2)
+        backwards = u2 < u1
+        u1, u2 = np.where(backwards, u2, u1), np.where(backwards, u1, u2)
+        v1, v2 = np.where(backwards, v2, v1), np.where(backwards, v1, v2)
+        du = u2 - u1
+        gradient = np.divide(v2 - v1, du, out=np.zeros_like(du), where=du > 0)
+
+        first = np.rint(u1).astype(np.int64)
+        steps = np.rint(u2).astype(np.int64) - first + 1
+        owners = np.repeat(np.arange(len(lines)), steps)
+        u = first[owners] + np.arange(len(owners)) - np.repeat(np.cumsum(steps) - steps, steps)
+        v = v1[owners] + gradient[owners] * (u - u1[owners])
+        base = np.floor(v)
+        fraction = v - base
+        base = base.astype(np.int64)
+
+        u = np.concatenate((u, u))
+        v = np.concatenate((base, base + 1))
+        alpha = np.concatenate((1 - fraction, fraction))
+        steep = np.concatenate((steep[owners], steep[owners]))
+        x = np.where(steep, v, u)
+        y = np.where(steep, u, v)
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height) & (alpha > 0)
+
+        coverage = np.zeros(self.width * self.height)
+        np.maximum.at(coverage, y[inside] * self.width + x[inside], alpha[inside])
+        touched = np.flatnonzero(coverage)
+        alpha = coverage[touched, None]
+        pixels = self.color.reshape(-1, 3)
+        pixels[touched] = np.rint(pixels[touched] * (1 - alpha) + np.asarray(color) * alpha).astype(np.uint8)
+
+    def to_ppm(self):
+        # Binarny PPM (P6) - format, ktory PhotoImage wczytuje bez dodatkowych bibliotek
+        return f'P6 {self.width} {self.height} 255 '.encode() + self.color.tobytes()
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_ppm())
+
+
+class CanvasImage:
+    # Jeden element canvasa z obrazem - cala klatka przekazywana do Tk jednym wywolaniem,
+    # zamiast elementu na kazda linie czy wielokat
+    def __init__(self, canvas, width, height, tag):
+        self.canvas = canvas
+        self.image = tk.PhotoImage(width=width, height=height)
+        self.item = canvas.create_image(0, 0, image=self.image, anchor='nw', state='hidden', tags=tag)
+        self.shown = False
+
+    def show(self, frame):
+        self.image.configure(data=frame.to_ppm(), format='PPM')
+        if not self.shown:
+            self.canvas.itemconfigure(self.item, state='normal')
+            self.shown = True
+
+    def hide(self):
+        if self.shown:
+            self.canvas.itemconfigure(self.item, state='hidden')
+            self.shown = False
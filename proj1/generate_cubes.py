@@ -1,48 +1,37 @@
-import json
-
-
-def save_cube_data(filename):
-    cube_data = generate_cube_grid()
-
-    serializable = []
-    for edge in cube_data:
-        serializable.append([
-            [float(coord) for coord in edge[0]],
-            [float(coord) for coord in edge[1]]
-        ])
-
-    with open(filename, 'w') as f:
-        json.dump(serializable, f)
-
-
-def generate_cube_grid():
-    size = 4
-    cubes = []
-    spacing = 1
-    cube_size = 1.2
-    for x in range(size):
-        for y in range(size):
-            for z in range(size):
-                base_x = x * (cube_size + spacing)
-                base_y = y * (cube_size + spacing)
-                base_z = z * (cube_size + spacing)
-
-                edges = [
-                    ((base_x, base_y, base_z), (base_x + cube_size, base_y, base_z)),
-                    ((base_x + cube_size, base_y, base_z), (base_x + cube_size, base_y + cube_size, base_z)),
-                    ((base_x + cube_size, base_y + cube_size, base_z), (base_x, base_y + cube_size, base_z)),
-                    ((base_x, base_y + cube_size, base_z), (base_x, base_y, base_z)),
-                    ((base_x, base_y, base_z + cube_size), (base_x + cube_size, base_y, base_z + cube_size)),
-                    ((base_x + cube_size, base_y, base_z + cube_size),
-                     (base_x + cube_size, base_y + cube_size, base_z + cube_size)),
-                    ((base_x + cube_size, base_y + cube_size, base_z + cube_size),
-                     (base_x, base_y + cube_size, base_z + cube_size)),
-                    ((base_x, base_y + cube_size, base_z + cube_size), (base_x, base_y, base_z + cube_size)),
-                    ((base_x, base_y, base_z), (base_x, base_y, base_z + cube_size)),
-                    ((base_x + cube_size, base_y, base_z), (base_x + cube_size, base_y, base_z + cube_size)),
-                    ((base_x + cube_size, base_y + cube_size, base_z),
-                     (base_x + cube_size, base_y + cube_size, base_z + cube_size)),
-                    ((base_x, base_y + cube_size, base_z), (base_x, base_y + cube_size, base_z + cube_size)),
-                ]
-                cubes.extend(edges)
-    return cubes
+import numpy as np
+
+from scene import InstancedScene, save_instanced_scene
+
+# Szablon jednego szescianu o boku 1 - rogi, krawedzie i sciany jako indeksy rogow
+CUBE_CORNERS = np.array([
+    [0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+    [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1],
+], dtype=float)
+CUBE_EDGES = np.array([
+    [0, 1], [1, 2], [2, 3], [3, 0],
+    [4, 5], [5, 6], [6, 7], [7, 4],
+    [0, 4], [1, 5], [2, 6], [3, 7],
+])
+CUBE_FACES = np.array([
+    [0, 3, 2, 1], [4, 5, 6, 7], [0, 1, 5, 4],
+    [1, 2, 6, 5], [2, 3, 7, 6], [3, 0, 4, 7],
+])
+
+
+def grid_bases(first, last, size, spacing, cube_size):
+    # Narozniki szescianow o numerach [first, last) - kolejnosc jak w petlach x, y, z (z najszybciej)
+    ids = np.arange(first, last)
+    cells = np.stack((ids // (size * size), ids // size % size, ids % size), axis=1)
+    return cells * (cube_size + spacing)
+
+
+def save_instance_data(prefix, size=4, spacing=1, cube_size=1.2):
+    save_instanced_scene(prefix, generate_cube_instances(size, spacing, cube_size))
+
+
+def generate_cube_instances(size=4, spacing=1, cube_size=1.2):
+    # Siatka jako jeden szescian-szablon i narozniki kopii - 3 liczby na szescian zamiast
+    # 8 wierzcholkow z krawedziami i scianami
+    return InstancedScene(CUBE_CORNERS * cube_size, CUBE_EDGES, CUBE_FACES,
+                          grid_bases(0, size ** 3, size, spacing, cube_size))
+
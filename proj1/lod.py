@@ -0,0 +1,35 @@
+import numpy as np
+
+# Poziomy szczegolowosci szescianu
+FULL = 0  # cala geometria
+SILHOUETTE = 1  # tylko kontur
+POINT = 2  # jeden punkt
+# Progi na srednice kuli otaczajacej po rzucie, w pikselach: od FULL_PIXELS cala geometria,
+# ponizej POINT_PIXELS punkt, pomiedzy kontur
+FULL_PIXELS = 32.0
+POINT_PIXELS = 4.0
+
+
+def projected_size(depth, radius, focal_length):
+    # Srednica kuli o promieniu radius w glebokosci depth po rzucie, w pikselach
+    return 2 * radius * focal_length / np.maximum(depth, 1e-9)
+
+
+def select_lod(depth, radius, focal_length, full_pixels=FULL_PIXELS, point_pixels=POINT_PIXELS):
+    # Poziom dla wszystkich szescianow naraz z glebokosci srodka (wzdluz osi kamery)
+    size = projected_size(depth, radius, focal_length)
+    level = np.full(len(depth), SILHOUETTE, dtype=np.int8)
+    level[size >= full_pixels] = FULL
+    level[size < point_pixels] = POINT
+    # szescian siegajacy za kamere - rzut srodka nic nie mowi o rozmiarze, wiec pelny
+    level[depth <= radius] = FULL
+    return level
+
+
+def unique_pixels(screen, width, height):
+    # Punkty zaokraglone do pikseli ekranu, kazdy piksel raz - ile by nie bylo punktow,
+    # do rysowania trafia najwyzej tyle, ile pikseli ma ekran
+    pixels = np.rint(screen).astype(np.int64)
+    inside = (pixels[:, 0] >= 0) & (pixels[:, 0] < width) & (pixels[:, 1] >= 0) & (pixels[:, 1] < height)
+    keys = np.unique(pixels[inside, 1] * width + pixels[inside, 0])
+    return np.stack((keys % width, keys // width), axis=1)
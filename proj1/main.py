@@ -2,11 +2,11 @@ import tkinter as tk
 
 from camera import CameraApp
 
-from generate_cubes import save_cube_data
+from generate_cubes import save_instance_data
 
 
 def main():
-    save_cube_data("cube_data.json")
+    save_instance_data("cube_instances")
 
     root = tk.Tk()
     app = CameraApp(root)
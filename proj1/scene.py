@@ -0,0 +1,84 @@
+import numpy as np
+
+# Scena instancjonowana - jeden szablon obiektu i przesuniecia jego kopii,
+# kazda tablica zapisywana do osobnego pliku {prefix}_{nazwa}.npy
+INSTANCE_ARRAYS = {
+    'template_vertices': np.float64,
+    'template_edges': np.int32,
+    'template_faces': np.int32,
+    'offsets': np.float64,
+}
+
+
+class InstancedScene:
+    # Scena z jednakowych obiektow: jeden szablon (wierzcholki, krawedzie, sciany) i przesuniecia
+    # kopii (N,3). Wierzcholki kopii nie sa nigdzie przechowywane - rzutowanie obraca szablon raz
+    # i dodaje obrocone przesuniecia. Wierzcholek k i-tej wybranej kopii ma numer i * K + k
+    def __init__(self, template_vertices, template_edges, template_faces, offsets):
+        self.template_vertices = template_vertices  # (K,3) float
+        self.template_edges = template_edges  # (Et,2) int - indeksy do template_vertices
+        self.template_faces = template_faces  # (Ft,4) int - indeksy do template_vertices
+        self.offsets = offsets  # (N,3) float - przesuniecie kazdej kopii
+
+        # AABB kopii: pudelko szablonu przesuniete o offset - do odrzucania calych szescianow
+        low = template_vertices.min(axis=0)
+        high = template_vertices.max(axis=0)
+        self.cube_bounds = np.stack((offsets + low, offsets + high), axis=1)
+
+        # Geometria szablonu liczona raz: kula otaczajaca (do poziomu szczegolowosci), normalne
+        # i srodki scian, sciany po obu stronach kazdej krawedzi (do konturu)
+        self.center = (low + high) / 2
+        self.radius = float(np.linalg.norm(high - low)) / 2
+        corners = template_vertices[template_faces]
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        self.face_normals = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+        self.face_centroids = corners.mean(axis=1)
+        self.edge_faces = edge_faces(template_edges, template_faces)
+
+    def instance_points(self, instance_ids):
+        # Pelne wspolrzedne wierzcholkow wybranych kopii (n*K,3) - gdy potrzebna jawna geometria
+        return (self.offsets[instance_ids][:, None, :] + self.template_vertices).reshape(-1, 3)
+
+    def edges_of_instances(self, count):
+        # Krawedzie count kolejnych wybranych kopii w numeracji i * K + k
+        first_vertex = np.arange(count)[:, None, None] * len(self.template_vertices)
+        return (self.template_edges + first_vertex).reshape(-1, 2)
+
+    def faces_of_instances(self, count):
+        first_vertex = np.arange(count)[:, None, None] * len(self.template_vertices)
+        return (self.template_faces + first_vertex).reshape(-1, self.template_faces.shape[1])
+
+    def front_faces(self, offsets, position):
+        # (n,Ft) maska scian kopii zwroconych do kamery: n . (c + o - pos) < 0, gdzie
+        # n . (c - pos) jest wspolne dla wszystkich kopii
+        shared = np.einsum('ij,ij->i', self.face_normals, self.face_centroids - position)
+        return shared + offsets @ self.face_normals.T < 0
+
+    def silhouette_edges(self, front):
+        # (n,Et) maska krawedzi konturu - jedna sciana krawedzi zwrocona do kamery, druga nie
+        return front[:, self.edge_faces[:, 0]] != front[:, self.edge_faces[:, 1]]
+
+
+def edge_faces(edges, faces):
+    # Dla kazdej krawedzi (E,2) numery dwoch scian, ktore ja zawieraja (bryla zamknieta -
+    # kazda krawedz nalezy do dokladnie dwoch scian). Krawedzie sciany to kolejne pary jej rogow
+    face_edges = np.stack((faces, np.roll(faces, -1, axis=1)), axis=2).reshape(-1, 2)
+    owners = np.repeat(np.arange(len(faces)), faces.shape[1])
+    size = int(faces.max()) + 1
+    keys = np.sort(face_edges, axis=1) @ [size, 1]
+    order = np.argsort(keys, kind='stable')
+    first = np.searchsorted(keys[order], np.sort(edges, axis=1) @ [size, 1])
+    return owners[order][np.stack((first, first + 1), axis=1)]
+
+
+def scene_path(prefix, name):
+    return f'{prefix}_{name}.npy'
+
+
+def save_instanced_scene(prefix, scene):
+    for name, dtype in INSTANCE_ARRAYS.items():
+        np.save(scene_path(prefix, name), np.ascontiguousarray(getattr(scene, name), dtype=dtype))
+
+
+def load_instanced_scene(prefix, mmap_mode='r'):
+    return InstancedScene(**{name: np.load(scene_path(prefix, name), mmap_mode=mmap_mode) for name in INSTANCE_ARRAYS})
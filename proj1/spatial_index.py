@@ -0,0 +1,142 @@
+import heapq
+
+import numpy as np
+
+from culling import boxes_in_frustum, classify_boxes
+
+
+def gather_ranges(starts, ends):
+    # Zlacz przedzialy [start, end) w jedna tablice indeksow bez petli po przedzialach
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return shifts + np.arange(total)
+
+
+class BVH:
+    # Hierarchia pudelek otaczajacych (BVH) nad AABB elementow sceny (szescianow albo wielokatow).
+    # Kazdy wezel obejmuje ciagly przedzial [start, end) tablicy order, wiec cale poddrzewo
+    # w srodku ostroslupa to po prostu jeden wycinek order. Budowana raz przy wczytaniu sceny.
+    def __init__(self, bounds, leaf_size=32):
+        self.item_bounds = np.asarray(bounds, dtype=float).reshape(-1, 2, 3)  # (N,2,3) - [min, max]
+        self.leaf_size = leaf_size
+        self.order = np.arange(len(self.item_bounds))
+        self.build()
+
+    def build(self):
+        if len(self.order) == 0:
+            # Pusta scena - bez wezlow; zapytania od razu zwracaja pusty wynik
+            self.node_start = self.node_end = self.node_left = self.node_right = np.empty(0, dtype=np.int64)
+            self.node_bounds = np.empty((0, 2, 3))
+            return
+        centers = self.item_bounds.mean(axis=1)
+        starts, ends, lefts, rights = [0], [len(self.order)], [-1], [-1]
+
+        # Podzial w medianie wzdluz najdluzszej osi srodkow
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            start, end = starts[node], ends[node]
+            if end - start <= self.leaf_size:
+                continue
+            items = self.order[start:end]
+            item_centers = centers[items]
+            axis = np.argmax(item_centers.max(axis=0) - item_centers.min(axis=0))
+            mid = (end - start) // 2
+            self.order[start:end] = items[np.argpartition(item_centers[:, axis], mid)]
+
+            for child_start, child_end in ((start, start + mid), (start + mid, end)):
+                starts.append(child_start)
+                ends.append(child_end)
+                lefts.append(-1)
+                rights.append(-1)
+            lefts[node] = len(starts) - 2
+            rights[node] = len(starts) - 1
+            stack.extend((lefts[node], rights[node]))
+
+        self.node_start = np.array(starts)
+        self.node_end = np.array(ends)
+        self.node_left = np.array(lefts)
+        self.node_right = np.array(rights)
+
+        # Pudelka wezlow od dolu - dzieci maja zawsze wieksze numery niz rodzic
+        self.node_bounds = np.empty((len(starts), 2, 3))
+        for node in range(len(starts) - 1, -1, -1):
+            left, right = lefts[node], rights[node]
+            if left < 0:
+                items = self.item_bounds[self.order[starts[node]:ends[node]]]
+                self.node_bounds[node, 0] = items[:, 0].min(axis=0)
+                self.node_bounds[node, 1] = items[:, 1].max(axis=0)
+            else:
+                self.node_bounds[node, 0] = np.minimum(self.node_bounds[left, 0], self.node_bounds[right, 0])
+                self.node_bounds[node, 1] = np.maximum(self.node_bounds[left, 1], self.node_bounds[right, 1])
+
+    def _query(self, node_test, item_test):
+        # Przejscie poziomami - caly front wezlow testowany jednym wywolaniem numpy
+        # node_test zwraca (poza, w calosci w srodku) dla pudelek, item_test - maske trafien
+        if len(self.order) == 0:
+            return np.empty(0, dtype=np.int64)
+        inside_ranges = []
+        leaf_ranges = []
+        frontier = np.array([0])
+        while len(frontier):
+            outside, inside = node_test(self.node_bounds[frontier])
+            inside_ranges.append(frontier[inside])
+            partial = frontier[~outside & ~inside]
+            is_leaf = self.node_left[partial] < 0
+            leaf_ranges.append(partial[is_leaf])
+            internal = partial[~is_leaf]
+            frontier = np.concatenate((self.node_left[internal], self.node_right[internal]))
+
+        inside_nodes = np.concatenate(inside_ranges)
+        leaf_nodes = np.concatenate(leaf_ranges)
+        hits = self.order[gather_ranges(self.node_start[inside_nodes], self.node_end[inside_nodes])]
+        candidates = self.order[gather_ranges(self.node_start[leaf_nodes], self.node_end[leaf_nodes])]
+        return np.concatenate((hits, candidates[item_test(self.item_bounds[candidates])]))
+
+    def query_frustum(self, normals, offsets):
+        # Elementy, ktorych AABB przecina ostroslup (plaszczyzny jak z culling.frustum_planes)
+        return self._query(
+            lambda bounds: classify_boxes(bounds, normals, offsets),
+            lambda bounds: boxes_in_frustum(bounds, normals, offsets),
+        )
+
+    def query_box(self, box_min, box_max):
+        # Elementy, ktorych AABB przecina pudelko [box_min, box_max]
+        box_min = np.asarray(box_min, dtype=float)
+        box_max = np.asarray(box_max, dtype=float)
+
+        def classify(bounds):
+            outside = np.any((bounds[:, 0] > box_max) | (bounds[:, 1] < box_min), axis=1)
+            inside = np.all((bounds[:, 0] >= box_min) & (bounds[:, 1] <= box_max), axis=1)
+            return outside, inside
+
+        return self._query(classify, lambda bounds: ~classify(bounds)[0])
+
+    def nearest(self, point):
+        # Generator (odleglosc, element) od najblizszego do najdalszego - przejscie best-first
+        point = np.asarray(point, dtype=float)
+
+        def box_distance(bounds):
+            gap = np.maximum(bounds[..., 0, :] - point, 0) + np.maximum(point - bounds[..., 1, :], 0)
+            return np.sqrt(np.sum(gap * gap, axis=-1))
+
+        if len(self.order) == 0:
+            return
+        # Na kopcu sa wezly (is_item=False) i pojedyncze elementy z lisci (is_item=True)
+        heap = [(float(box_distance(self.node_bounds[0])), False, 0)]
+        while heap:
+            distance, is_item, index = heapq.heappop(heap)
+            if is_item:
+                yield distance, index
+                continue
+            left = self.node_left[index]
+            if left < 0:
+                items = self.order[self.node_start[index]:self.node_end[index]]
+                for item, item_distance in zip(items.tolist(), box_distance(self.item_bounds[items]).tolist()):
+                    heapq.heappush(heap, (item_distance, True, item))
+            else:
+                for child in (left, self.node_right[index]):
+                    heapq.heappush(heap, (float(box_distance(self.node_bounds[child])), False, int(child)))
@@ -0,0 +1,199 @@
+import os
+import sys
+import time
+import timeit
+
+import numpy as np
+
+from bsp import BACK, FRONT, BSPNode, DynamicBSP, FlatBSP
+from generate_cubes import CUBE_CORNERS, CUBE_FACES, generate_voxel_grid
+from voxels import VoxelScene
+
+
+def recursive_visible_polygons(node, camera_position):
+    # Poprzednia wersja BSPNode.get_visible_polygons - rekurencja i nowa lista na kazdym wezle
+    result = []
+
+    if not node.plane:
+        return node.polygons
+
+    if node.plane.classify_point(camera_position) != BACK:
+        if node.back:
+            result.extend(recursive_visible_polygons(node.back, camera_position))
+        result.extend(node.polygons)
+        if node.front:
+            result.extend(recursive_visible_polygons(node.front, camera_position))
+    else:
+        if node.front:
+            result.extend(recursive_visible_polygons(node.front, camera_position))
+        result.extend(node.polygons)
+        if node.back:
+            result.extend(recursive_visible_polygons(node.back, camera_position))
+
+    return result
+
+
+def cube_grid_polygons(size, spacing=1.0, cube_size=1.2):
+    axis = np.arange(size) * (cube_size + spacing)
+    bases = np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1).reshape(-1, 3)
+    corners = bases[:, None, :] + CUBE_CORNERS * cube_size
+    return corners[:, CUBE_FACES].reshape(-1, 4, 3).tolist()
+
+
+def parallel_quads(count):
+    # Rownolegle kwadraty - z plaszczyzna pierwszego jako dzielaca drzewo jest lancuchem o glebokosci count
+    return [[(0.0, 0.0, float(z)), (1.0, 0.0, float(z)), (1.0, 1.0, float(z)), (0.0, 1.0, float(z))]
+            for z in range(count)]
+
+
+def benchmark(name, polygons, camera_position, repeat=5):
+    tree = BSPNode(polygons)
+    flat = FlatBSP.from_node(tree)
+    stats = tree.stats()
+    print(f"{name}: {stats['nodes']} wezlow, glebokosc {stats['depth']}, {stats['polygons']} wielokatow")
+
+    candidates = {
+        'rekurencyjne': lambda: recursive_visible_polygons(tree, camera_position),
+        'iteracyjne': lambda: tree.get_visible_polygons(camera_position),
+        'generator': lambda: sum(1 for _ in tree.iter_visible_polygons(camera_position)),
+        'FlatBSP': lambda: flat.get_visible_polygons(np.asarray(camera_position)),
+    }
+    for label, run in candidates.items():
+        try:
+            seconds = min(timeit.repeat(run, number=1, repeat=repeat))
+            print(f"  {label:>14}: {seconds * 1000:8.2f} ms")
+        except RecursionError:
+            print(f"  {label:>14}: RecursionError (limit {sys.getrecursionlimit()})")
+
+
+def benchmark_build(name, polygons, workers=os.cpu_count()):
+    # Budowa seryjna i rownolegla - drzewa musza wyjsc identyczne
+    start = time.perf_counter()
+    serial = FlatBSP.from_node(BSPNode(polygons, splitter='axis'))
+    middle = time.perf_counter()
+    parallel = FlatBSP.from_node(BSPNode(polygons, splitter='axis', workers=workers))
+    end = time.perf_counter()
+    same = all(np.array_equal(getattr(serial, key), getattr(parallel, key))
+               for key in ('planes', 'front', 'back', 'node_polygons', 'vertices', 'polygon_ids'))
+    print(f"{name}: budowa seryjna {middle - start:.2f} s, {workers} procesow {end - middle:.2f} s, "
+          f"{'identyczne' if same else 'ROZNE'}")
+
+
+def polygon_area(points):
+    # Pole wielokata plaskiego - polowa dlugosci sumy iloczynow wektorowych kolejnych bokow
+    points = np.asarray(points, dtype=float)
+    return np.linalg.norm(np.cross(points, np.roll(points, -1, axis=0)).sum(axis=0)) / 2
+
+
+def check_dynamic(tree):
+    # Drzewo po edycjach zgodne z zywymi wielokatami: kazdy kawalek lezy w plaszczyznie swojego wezla
+    # i po wlasciwej stronie plaszczyzn wszystkich przodkow, holders wskazuje dokladnie wezly
+    # z kawalkami wielokata, a kawalki kazdego wielokata pokrywaja go w calosci (suma pol)
+    areas = dict.fromkeys(tree.polygons, 0.0)
+    held = {polygon_id: set() for polygon_id in tree.polygons}
+    dead = 0
+    stack = [(tree.root, [])]
+    while stack:
+        node, ancestors = stack.pop()
+        if not node.polygons and node.plane is not None:
+            dead += 1
+        for polygon_id, piece in zip(node.polygon_ids, node.polygons):
+            assert polygon_id in areas, f"usuniety wielokat {polygon_id} nadal w drzewie"
+            assert np.all(np.abs(node.plane.signed_distances(piece)) < 1e-6), "kawalek poza plaszczyzna wezla"
+            for plane, side in ancestors:
+                distances = plane.signed_distances(piece)
+                assert np.all(distances > -1e-6) if side == FRONT else np.all(distances < 1e-6), \
+                    "kawalek po zlej stronie plaszczyzny przodka"
+            areas[polygon_id] += polygon_area(piece)
+            held[polygon_id].add(id(node))
+        for child, side in ((node.front, FRONT), (node.back, BACK)):
+            if child:
+                stack.append((child, ancestors + [(node.plane, side)]))
+    assert dead == tree.dead_nodes, f"martwe wezly: {dead}, licznik {tree.dead_nodes}"
+    for polygon_id, points in tree.polygons.items():
+        assert held[polygon_id] == {id(node) for node in tree.holders.get(polygon_id, ())}, "holders niezgodne z drzewem"
+        assert np.isclose(areas[polygon_id], polygon_area(points)), f"kawalki wielokata {polygon_id} niepelne"
+
+
+def benchmark_dynamic(name, polygons, edits=2000, check_every=250, seed=0):
+    # Edycje DynamicBSP (na przemian wstawienia losowych kwadratow i usuniecia losowych wielokatow)
+    # wobec pelnej przebudowy z tych samych wielokatow; drzewo sprawdzane co check_every edycji
+    rng = np.random.default_rng(seed)
+    tree = DynamicBSP(polygons, splitter='axis')
+    low, high = np.min(polygons, axis=(0, 1)), np.max(polygons, axis=(0, 1))
+    built_depth = tree.built_depth
+    print(f"{name}: {len(polygons)} wielokatow, glebokosc {built_depth}")
+
+    insert_seconds, remove_seconds, inserts, removes, compactions, depths = 0.0, 0.0, 0, 0, 0, []
+    for edit in range(edits):
+        root = tree.root
+        if edit % 2 == 0:
+            # kwadrat rownolegly do losowej plaszczyzny ukladu - zwykle przecina czesc plaszczyzn drzewa
+            axis = rng.integers(3)
+            corner = rng.uniform(low, high)
+            size = rng.uniform(0.2, 3.0)
+            u, v = np.eye(3)[(axis + 1) % 3] * size, np.eye(3)[(axis + 2) % 3] * size
+            start = time.perf_counter()
+            tree.insert([corner, corner + u, corner + u + v, corner + v])
+            insert_seconds += time.perf_counter() - start
+            inserts += 1
+        else:
+            polygon_id = int(rng.choice(list(tree.polygons)))
+            start = time.perf_counter()
+            tree.remove(polygon_id)
+            remove_seconds += time.perf_counter() - start
+            removes += 1
+        compactions += tree.root is not root
+        depths.append(tree.depth)
+        if (edit + 1) % check_every == 0:
+            check_dynamic(tree)
+
+    start = time.perf_counter()
+    BSPNode(list(tree.polygons.values()), splitter='axis')
+    rebuild = time.perf_counter() - start
+
+    # Same usuniecia - martwych wezlow przybywa, az drzewo samo sie przebuduje
+    root = tree.root
+    removed = 0
+    for polygon_id in rng.permutation(list(tree.polygons)):
+        tree.remove(int(polygon_id))
+        removed += 1
+        if tree.root is not root:
+            break
+    assert tree.root is not root, "compact() nie zostal wywolany"
+    assert tree.dead_nodes == 0, "martwe wezly po przebudowie"
+    check_dynamic(tree)
+    print(f"  wstawienie {insert_seconds / inserts * 1000:.2f} ms, usuniecie {remove_seconds / removes * 1000:.2f} ms, "
+          f"przebudowa {rebuild * 1000:.0f} ms")
+    print(f"  glebokosc srednio {np.mean(depths):.1f} (po budowie {built_depth}), "
+          f"przebudowy przez degradacje: {compactions}")
+    print(f"  same usuniecia: przebudowa po {removed} usunieciach, drzewo zgodne z wielokatami")
+
+
+def terrain(size, seed=0):
+    # Teren z mapy wysokosci - zajetosc nieregularna, ale wnetrze nadal pelne
+    rng = np.random.default_rng(seed)
+    x, y = np.meshgrid(np.arange(size), np.arange(size), indexing='ij')
+    height = size / 2 + size / 4 * np.sin(x / 5 + rng.uniform(0, 6)) * np.cos(y / 7 + rng.uniform(0, 6))
+    return np.arange(size) < np.rint(height)[:, :, None]
+
+
+def benchmark_voxels(name, scene):
+    # Ile wielokatow trafia do BSPNode: wszystkie sciany komorek, tylko widoczne, widoczne polaczone
+    cells = int(scene.occupancy.sum())
+    print(f"{name}: {cells} komorek")
+    for label, faces in (('widoczne', scene.faces(greedy=False)), ('polaczone', scene.faces())):
+        start = time.perf_counter()
+        stats = BSPNode(faces.tolist(), splitter='axis').stats()
+        seconds = time.perf_counter() - start
+        print(f"  {label:>10}: {len(faces):7d} z {6 * cells} scian, {stats['nodes']} wezlow, budowa {seconds:.2f} s")
+
+
+if __name__ == "__main__":
+    benchmark("siatka 10x10x10", cube_grid_polygons(10), (3.0, 3.0, -10.0))
+    benchmark("lancuch 500", parallel_quads(500), (0.5, 0.5, 250.5))
+    benchmark("lancuch 5000", parallel_quads(5000), (0.5, 0.5, 2500.5))
+    benchmark_build("budowa siatki 16x16x16", cube_grid_polygons(16))
+    benchmark_voxels("wokseli 16x16x16", generate_voxel_grid(16))
+    benchmark_voxels("teren 32x32x32", VoxelScene(terrain(32), 1.2))
+    benchmark_dynamic("edycje siatki 8x8x8", cube_grid_polygons(8))
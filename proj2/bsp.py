@@ -0,0 +1,821 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import numpy as np
+
+from culling import boxes_in_frustum, classify_boxes
+from spatial_index import gather_ranges
+
+# Strona wzgledem plaszczyzny jako flagi bitowe - wielokat przecinajacy to FRONT | BACK
+COPLANAR = 0
+FRONT = 1
+BACK = 2
+SPANNING = FRONT | BACK
+
+
+class Plane:
+    def __init__(self, point, normal):
+        self.point = np.array(point)
+        self.normal = np.array(normal)
+
+        self.normal = self.normal / np.linalg.norm(self.normal)
+        # n . x - offset to odleglosc punktu x od plaszczyzny
+        self.offset = float(np.dot(self.normal, self.point))
+
+    def classify_point(self, point):
+        # Oblicz iloczyn skalarny zeby wiedziec z ktorej strony plaszczyzny jest punkt
+        v = np.array(point) - self.point
+        dot = np.dot(v, self.normal)
+
+        if dot > 1e-6:
+            return FRONT
+        elif dot < -1e-6:
+            return BACK
+        else:
+            return COPLANAR
+
+    def classify_polygon(self, polygon):
+        # Gdzie lezy wielokat wzgledem plaszczyzny - suma bitowa stron wierzcholkow
+        classification = COPLANAR
+        for point in polygon:
+            classification |= self.classify_point(point)
+        return classification
+
+    def signed_distances(self, points):
+        # Odleglosci wielu punktow (V,3) od plaszczyzny jedna operacja
+        return (np.asarray(points, dtype=float) - self.point) @ self.normal
+
+    def classify_polygons(self, points, starts):
+        # Klasyfikacja wszystkich wielokatow naraz - points (V,3) to zlaczone wierzcholki,
+        # starts to poczatki kolejnych wielokatow. Zwraca (odleglosci wierzcholkow (V,),
+        # strony wierzcholkow (V,), strony wielokatow (P,)) - strony jako flagi FRONT/BACK
+        distances = self.signed_distances(points)
+        sides = vertex_sides(distances)
+        return distances, sides, np.bitwise_or.reduceat(sides, starts)
+
+    def split_polygon(self, polygon, distances=None):
+        # Podziel wielokat przez plaszczyzne
+        # Zwraca front_poly, back_poly jako tablice (k,3) albo None
+        polygon = np.asarray(polygon, dtype=float)
+        if distances is None:
+            distances = self.signed_distances(polygon)
+        front, back = self.split_polygons(polygon, np.array([0]), np.array([len(polygon)]), distances)
+        return front[0] if len(front[1]) else None, back[0] if len(back[1]) else None
+
+    def split_polygons(self, points, starts, lengths, distances):
+        # Podziel wiele wielokatow naraz, korzystajac z policzonych juz odleglosci wierzcholkow
+        # (np. z classify_polygons). Zwraca dla przodu i tylu trojki
+        # (punkty kawalkow, dlugosci kawalkow, numery wielokatow zrodlowych)
+        owners = np.repeat(np.arange(len(starts)), lengths)
+        next_index = np.arange(1, len(points) + 1)
+        next_index[starts + lengths - 1] = starts
+
+        sides = vertex_sides(distances)
+        next_distances = distances[next_index]
+
+        # Jesli krawedz przecina plaszczyzne, punkt przeciecia trafia do obu stron
+        crossing = (sides | sides[next_index]) == SPANNING
+        t = np.divide(distances, distances - next_distances, out=np.zeros_like(distances), where=crossing)
+        intersections = points + t[:, None] * (points[next_index] - points)
+
+        # Kazdy wierzcholek i ewentualne przeciecie za nim - w tej kolejnosci wzdluz obwodu
+        candidates = np.empty((2 * len(points), 3))
+        candidates[0::2] = points
+        candidates[1::2] = intersections
+        candidate_owners = np.repeat(owners, 2)
+        front = collect_pieces(candidates, candidate_owners, sides != BACK, crossing, len(starts))
+        back = collect_pieces(candidates, candidate_owners, sides != FRONT, crossing, len(starts))
+        return front, back
+
+
+def collect_pieces(candidates, owners, keep_vertices, crossing, polygon_count):
+    # Wybierz punkty jednej strony podzialu; kawalki z mniej niz 3 punktami odpadaja
+    mask = np.empty(len(candidates), dtype=bool)
+    mask[0::2] = keep_vertices
+    mask[1::2] = crossing
+    piece_owners = owners[mask]
+    piece_lengths = np.bincount(piece_owners, minlength=polygon_count)
+    valid = piece_lengths >= 3
+    return candidates[mask][valid[piece_owners]], piece_lengths[valid], np.flatnonzero(valid)
+
+
+def vertex_sides(distances):
+    # Strony punktow jako flagi FRONT/BACK/COPLANAR z odleglosci od plaszczyzny
+    sides = np.zeros(len(distances), dtype=np.int8)
+    sides[distances > 1e-6] = FRONT
+    sides[distances < -1e-6] = BACK
+    return sides
+
+
+def polygon_plane(polygon):
+    # Plaszczyzna wielokata z jego trzech pierwszych punktow
+    p1, p2, p3 = polygon[0], polygon[1], polygon[2]
+
+    # Oblicz wektor normalny przez iloczyn wektorowy (rozpisany - np.cross jest wolny dla jednego wektora)
+    (x1, y1, z1), (x2, y2, z2), (x3, y3, z3) = p1, p2, p3
+    ax, ay, az = x2 - x1, y2 - y1, z2 - z1
+    bx, by, bz = x3 - x1, y3 - y1, z3 - z1
+    return Plane(p1, (ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx))
+
+
+def pack_polygons(polygons):
+    # Wszystkie wierzcholki wielokatow w jednej tablicy (V,3) + poczatek i dlugosc kazdego wielokata
+    if isinstance(polygons, np.ndarray):
+        # Tablica (F,k,3) (np. sciany sceny z pliku .npy) - bez rozpakowywania na listy punktow
+        lengths = np.full(len(polygons), polygons.shape[1])
+        return np.asarray(polygons, dtype=float).reshape(-1, 3), lengths_to_starts(lengths), lengths
+    lengths = np.array([len(poly) for poly in polygons])
+    starts = lengths_to_starts(lengths)
+    points = np.array([point for poly in polygons for point in poly], dtype=float)
+    return points, starts, lengths
+
+
+def packed_plane(packed, polygon):
+    points, starts, lengths = packed
+    return polygon_plane(points[starts[polygon]:starts[polygon] + lengths[polygon]])
+
+
+def select_polygons(packed, ids, selected, pieces):
+    # Nowy zestaw spakowanych wielokatow: wybrane w calosci (indeksy selected) i kawalki po
+    # podziale (trojka z split_polygons) - w kolejnosci wielokatow zrodlowych
+    points, starts, lengths = packed
+    whole_points = points[gather_ranges(starts[selected], starts[selected] + lengths[selected])]
+    piece_points, piece_lengths, sources = pieces
+    if not len(sources):
+        new_lengths = lengths[selected]
+        return (whole_points, lengths_to_starts(new_lengths), new_lengths), ids[selected]
+
+    keys = np.concatenate((selected, sources))
+    all_lengths = np.concatenate((lengths[selected], piece_lengths))
+    all_points = np.concatenate((whole_points, piece_points))
+    all_starts = lengths_to_starts(all_lengths)
+
+    order = np.argsort(keys, kind='stable')
+    new_lengths = all_lengths[order]
+    new_points = all_points[gather_ranges(all_starts[order], all_starts[order] + new_lengths)]
+    return (new_points, lengths_to_starts(new_lengths), new_lengths), ids[keys[order]]
+
+
+def lengths_to_starts(lengths):
+    starts = np.zeros(len(lengths), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    return starts
+
+
+def polygon_normals(points, starts):
+    # Jednostkowe normalne wszystkich wielokatow z trzech pierwszych punktow, jak w polygon_plane
+    normals = np.cross(points[starts + 1] - points[starts], points[starts + 2] - points[starts])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+
+# Sposoby wyboru plaszczyzny podzialu w BSPNode:
+#   'first'   - plaszczyzna pierwszego wielokata
+#   'sampled' - najlepsza z probki kandydatow wg kosztu: podzialy i nierownowaga przod/tyl
+#   'axis'    - kandydaci prostopadli do osi, najblizej mediany sceny (dla siatek szescianow)
+SPLITTERS = ('first', 'sampled', 'axis')
+# Przy wiekszych wezlach koszt kandydatow liczony na probce tylu wielokatow
+SCORE_SAMPLE = 512
+MIN_SCORED_POLYGONS = 16
+# Brak kawalkow po podziale - (punkty, dlugosci, zrodla)
+NO_PIECES = (np.empty((0, 3)), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+# Przy budowie rownoleglej mniejsze poddrzewa nie sa warte przesylania do innego procesu
+PARALLEL_THRESHOLD = 2000
+# Procesy robocze startowane bez fork - kopia procesu z dzialajacym Tk i watkami moze sie zakleszczyc
+POOL_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+# Co ile sekund czekanie na wyniki procesow sprawdza, czy budowa nie zostala przerwana
+CANCEL_POLL_S = 0.1
+
+
+class BuildCancelled(Exception):
+    pass
+
+
+def check_cancelled(cancel):
+    # cancel - obiekt z is_set() (np. threading.Event) ustawiany, gdy budowa ma sie przerwac
+    if cancel is not None and cancel.is_set():
+        raise BuildCancelled()
+
+
+def build_pending(pending, progress=None, cancel=None):
+    # Buduj wezly ze stosu (wezel, wielokaty, numery) az do lisci
+    # progress(gotowe, czekajace) - wielokaty juz umieszczone w wezlach i jeszcze do podzialu
+    done = 0
+    waiting = sum(len(ids) for _, _, ids in pending)
+    while pending:
+        check_cancelled(cancel)
+        node, packed, ids = pending.pop()
+        children = node.build_packed(packed, ids)
+        pending.extend(children)
+        if progress:
+            done += len(node.polygon_ids)
+            waiting += sum(len(child_ids) for _, _, child_ids in children) - len(ids)
+            progress(done, waiting)
+
+
+# Flaga przerwania w procesie roboczym - ustawiana przez init_worker przy starcie procesu
+worker_cancel = None
+
+
+def init_worker(cancel):
+    global worker_cancel
+    worker_cancel = cancel
+
+
+def build_subtree(options, packed, ids):
+    # Uruchamiane w procesie roboczym - zwraca poddrzewo jako plaska liste rekordow,
+    # bo pickle zagniezdzonych wezlow rekurencyjnie wysypuje sie na glebokich drzewach
+    node = BSPNode(**options)
+    build_pending([(node, packed, ids)], cancel=worker_cancel)
+    return node.to_records()
+
+
+class BSPNode:
+    def __init__(self, polygons=None, ids=None, splitter='first', sample_size=16, split_cost=8.0,
+                 balance_cost=1.0, workers=None, parallel_threshold=PARALLEL_THRESHOLD, progress=None,
+                 cancel=None):
+        if splitter not in SPLITTERS:
+            raise ValueError(f"Nieznany splitter: {splitter}")
+        self.splitter = splitter
+        self.sample_size = sample_size
+        self.split_cost = split_cost
+        self.balance_cost = balance_cost
+
+        self.plane = None
+        self.front = None
+        self.back = None
+        self.polygons = []
+        # Numer wielokata zrodlowego dla kazdego wielokata wezla - kawalki po podziale dziedzicza numer
+        self.polygon_ids = []
+
+        if polygons is not None and len(polygons):
+            self.build(polygons, ids, workers, parallel_threshold, progress, cancel)
+
+    def build(self, polygons, ids=None, workers=None, parallel_threshold=PARALLEL_THRESHOLD, progress=None,
+              cancel=None):
+        # polygons - lista wielokatow (list punktow) albo tablica (F,k,3) wielokatow o rownej liczbie rogow
+        # workers > 1 - duze poddrzewa budowane w osobnych procesach, drzewo identyczne jak seryjne
+        # cancel ustawione w trakcie - BuildCancelled, drzewo zostaje niekompletne
+        if not len(polygons):
+            return
+        if ids is None:
+            ids = list(range(len(polygons)))
+
+        # Wielokaty pakowane raz - dalej cala budowa idzie na tablicach
+        # Bez rekurencji: stos wezlow czekajacych na podzial, wiec glebokosc drzewa nie ma limitu
+        pending = [(self, pack_polygons(polygons), np.asarray(ids))]
+        if workers and workers > 1 and len(polygons) >= parallel_threshold:
+            self.build_parallel(pending, workers, parallel_threshold, progress, cancel)
+        else:
+            build_pending(pending, progress, cancel)
+
+    def build_parallel(self, pending, workers, threshold, progress=None, cancel=None):
+        # Gorne poziomy seryjnie, az poddrzewa beda dosc male, zeby rozlozyc je na procesy.
+        # Poddrzewa ponizej progu buduje ten proces w czasie, gdy pula liczy reszte
+        chunk = max(threshold, len(pending[0][1][1]) // (4 * workers))
+        options = {'splitter': self.splitter, 'sample_size': self.sample_size,
+                   'split_cost': self.split_cost, 'balance_cost': self.balance_cost}
+        jobs = []
+        done = 0
+        waiting = len(pending[0][2])
+        # threading.Event nie przechodzi do innych procesow - procesy robocze dostaja wlasna flage
+        worker_stop = POOL_CONTEXT.Event()
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT, initializer=init_worker,
+                                   initargs=(worker_stop,))
+        try:
+            while pending:
+                check_cancelled(cancel)
+                node, packed, ids = pending.pop()
+                if threshold <= len(packed[1]) <= chunk:
+                    jobs.append((node, len(ids), pool.submit(build_subtree, options, packed, ids)))
+                    continue
+                children = node.build_packed(packed, ids)
+                pending.extend(children)
+                if progress:
+                    done += len(node.polygon_ids)
+                    waiting += sum(len(child_ids) for _, _, child_ids in children) - len(ids)
+                    progress(done, waiting)
+            for node, count, job in jobs:
+                while not wait([job], timeout=CANCEL_POLL_S).done:
+                    check_cancelled(cancel)
+                records = job.result()
+                node.load_records(records)
+                if progress:
+                    done += sum(len(record[2]) for record in records)
+                    waiting -= count
+                    progress(done, waiting)
+        except BuildCancelled:
+            # Zadania jeszcze nie rozpoczete sa anulowane, a liczone przerywaja sie na fladze procesow
+            # roboczych - czekanie na pule trwa najwyzej jeden podzial wezla albo start procesu
+            worker_stop.set()
+            pool.shutdown(cancel_futures=True)
+            raise
+        finally:
+            pool.shutdown()
+
+    def to_records(self):
+        # Poddrzewo w kolejnosci pre-order (przod przed tylem):
+        # (plaszczyzna, wielokaty, numery, czy jest przod, czy jest tyl)
+        records = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            records.append((node.plane, node.polygons, node.polygon_ids, node.front is not None,
+                            node.back is not None))
+            if node.back:
+                stack.append(node.back)
+            if node.front:
+                stack.append(node.front)
+        return records
+
+    def load_records(self, records):
+        # Odtworz poddrzewo z to_records w miejscu tego wezla
+        stack = [self]
+        for plane, polygons, polygon_ids, has_front, has_back in records:
+            node = stack.pop()
+            node.plane, node.polygons, node.polygon_ids = plane, polygons, polygon_ids
+            if has_back:
+                node.back = node.child()
+                stack.append(node.back)
+            if has_front:
+                node.front = node.child()
+                stack.append(node.front)
+
+    def build_packed(self, packed, ids):
+        # Podziel wielokaty tego wezla; zwraca liste (dziecko, jego wielokaty, ich numery) do zbudowania
+        points, starts, lengths = packed
+
+        # Stworz plaszczyzne podzialu z wielokata wybranego przez splitter
+        self.plane = packed_plane(packed, self.choose_splitter(packed))
+        if len(starts) == 1:
+            # Jedyny wielokat lezy na wlasnej plaszczyznie - lisc bez klasyfikacji
+            self.polygons = [points]
+            self.polygon_ids = ids.tolist()
+            return []
+
+        # Podziel wielokaty na front, back i coplanar - wszystkie odleglosci jedna operacja
+        distances, _, classifications = self.plane.classify_polygons(points, starts)
+
+        coplanar = np.flatnonzero(classifications == COPLANAR)
+        # Dodaj do wielokatow tego wezla
+        self.polygons = [points[starts[i]:starts[i] + lengths[i]] for i in coplanar.tolist()]
+        self.polygon_ids = ids[coplanar].tolist()
+
+        # Podziel przecinajace wielokaty naraz, korzystajac z juz policzonych odleglosci
+        spanning = np.flatnonzero(classifications == SPANNING)
+        front_pieces = back_pieces = NO_PIECES
+        if len(spanning):
+            vertex_ids = gather_ranges(starts[spanning], starts[spanning] + lengths[spanning])
+            front_pieces, back_pieces = self.plane.split_polygons(
+                points[vertex_ids], lengths_to_starts(lengths[spanning]), lengths[spanning], distances[vertex_ids])
+            front_pieces = front_pieces[:2] + (spanning[front_pieces[2]],)
+            back_pieces = back_pieces[:2] + (spanning[back_pieces[2]],)
+
+        # Poddrzewa do zbudowania
+        children = []
+        front = np.flatnonzero(classifications == FRONT)
+        if len(front) or len(front_pieces[2]):
+            self.front = self.child()
+            children.append((self.front, *select_polygons(packed, ids, front, front_pieces)))
+        back = np.flatnonzero(classifications == BACK)
+        if len(back) or len(back_pieces[2]):
+            self.back = self.child()
+            children.append((self.back, *select_polygons(packed, ids, back, back_pieces)))
+        return children
+
+    def child(self):
+        return BSPNode(None, None, self.splitter, self.sample_size, self.split_cost, self.balance_cost)
+
+    def choose_splitter(self, packed):
+        # Zwraca indeks wielokata, ktorego plaszczyzna podzieli ten wezel
+        # Przy malych wezlach wybor nie zmienia wiele, a kosztuje wiecej niz sam podzial
+        polygon_count = len(packed[1])
+        if self.splitter == 'first' or polygon_count <= MIN_SCORED_POLYGONS:
+            return 0
+
+        candidates = []
+        if self.splitter == 'axis':
+            candidates = self.axis_candidates(packed)
+        if not candidates:
+            # Probka co step-ty wielokat - deterministyczna, wiec drzewo jest zawsze takie samo
+            step = max(1, polygon_count // self.sample_size)
+            candidates = list(range(0, polygon_count, step))[:self.sample_size]
+        return self.best_candidate(candidates, packed)
+
+    def axis_candidates(self, packed):
+        # Dla kazdej osi wielokat prostopadly do niej, lezacy najblizej mediany srodkow wielokatow
+        points, starts, lengths = packed
+        normals = polygon_normals(points, starts)
+        centroids = np.add.reduceat(points, starts, axis=0) / lengths[:, None]
+        candidates = []
+        for axis in range(3):
+            aligned = np.flatnonzero(np.abs(normals[:, axis]) > 1 - 1e-6)
+            if len(aligned):
+                median = np.median(centroids[:, axis])
+                candidates.append(int(aligned[np.argmin(np.abs(centroids[aligned, axis] - median))]))
+        return candidates
+
+    def best_candidate(self, candidates, packed):
+        # Koszt kandydata = split_cost * liczba podzielonych + balance_cost * |przod - tyl|
+        # Odleglosci wierzcholkow od wszystkich kandydatow liczone jedna operacja; przy duzych
+        # wezlach koszt liczony na rownomiernej probce wielokatow
+        planes = [packed_plane(packed, i) for i in candidates]
+        points, starts, lengths = packed
+        step = max(1, len(starts) // SCORE_SAMPLE)
+        if step > 1:
+            sample = np.arange(0, len(starts), step)
+            points = points[gather_ranges(starts[sample], starts[sample] + lengths[sample])]
+            starts = lengths_to_starts(lengths[sample])
+
+        normals = np.array([plane.normal for plane in planes])
+        offsets = np.array([np.dot(plane.point, plane.normal) for plane in planes])
+        distances = points @ normals.T - offsets
+
+        front = np.add.reduceat((distances > 1e-6).astype(np.int32), starts, axis=0) > 0
+        back = np.add.reduceat((distances < -1e-6).astype(np.int32), starts, axis=0) > 0
+        spanning = np.sum(front & back, axis=0)
+        imbalance = np.abs(np.sum(front & ~back, axis=0) - np.sum(back & ~front, axis=0))
+        cost = self.split_cost * spanning + self.balance_cost * imbalance
+        return candidates[int(np.argmin(cost))]
+
+    def stats(self):
+        # Liczba wezlow, glebokosc drzewa i liczba wielokatow (z kawalkami po podzialach)
+        nodes, depth, polygons = 0, 0, 0
+        stack = [(self, 1)]
+        while stack:
+            node, level = stack.pop()
+            nodes += 1
+            depth = max(depth, level)
+            polygons += len(node.polygons)
+            stack.extend((child, level + 1) for child in (node.front, node.back) if child)
+        return {'nodes': nodes, 'depth': depth, 'polygons': polygons}
+
+    def get_visible_polygons(self, camera_position, with_ids=False, out=None):
+        # Wielokaty od najdalszego do najblizszego, dopisywane do jednej listy out
+        # with_ids=True - zamiast wielokatow pary (numer wielokata zrodlowego, wielokat)
+        if out is None:
+            out = []
+        for node in self.nodes_back_to_front(camera_position):
+            out.extend(zip(node.polygon_ids, node.polygons) if with_ids else node.polygons)
+        return out
+
+    def iter_visible_polygons(self, camera_position):
+        # To samo co get_visible_polygons, ale jako generator - bez budowania listy
+        for node in self.nodes_back_to_front(camera_position):
+            yield from node.polygons
+
+    def nodes_back_to_front(self, camera_position):
+        # Wezly w kolejnosci malowania, bez rekurencji - jawny stos, na ktorym krotka (wezel,)
+        # oznacza "oddaj wielokaty tego wezla", a sam wezel - "przejdz jego poddrzewo"
+        camera = np.asarray(camera_position, dtype=float)
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.__class__ is tuple:
+                yield node[0]
+                continue
+            # Jesli nie ma plaszczyzny, to jest lisc w drzewie
+            plane = node.plane
+            if not plane:
+                yield node
+                continue
+
+            # Kamera z przodu lub na plaszczyznie - najpierw tyl (dalej od kamery), potem przod
+            if plane.normal @ camera - plane.offset >= -1e-6:
+                near, far = node.front, node.back
+            else:
+                near, far = node.back, node.front
+
+            # Stos zdejmuje od konca, wiec dalsza strona na wierzch
+            if near:
+                stack.append(near)
+            stack.append((node,))
+            if far:
+                stack.append(far)
+
+
+class DynamicBSP:
+    # Drzewo BSP ze zmienna geometria - wstawienie albo usuniecie wielokata kosztuje tyle, co
+    # zejscie wzdluz drzewa, a nie pelna przebudowe. Usuniety wielokat znika z wezlow, ale ich
+    # plaszczyzny zostaja (martwe wezly bez wielokatow). Gdy martwych wezlow jest za duzo albo
+    # drzewo jest za glebokie, compact() buduje je od nowa z zywych wielokatow
+    def __init__(self, polygons=(), max_dead_ratio=0.5, depth_factor=2.0, **build_options):
+        self.max_dead_ratio = max_dead_ratio
+        self.depth_factor = depth_factor
+        self.build_options = build_options
+        self.polygons = {}  # numer -> wielokat zrodlowy (k,3)
+        self.holders = {}  # numer -> wezly z kawalkami tego wielokata
+        self.next_id = 0
+        for polygon in polygons:
+            self.polygons[self.next_id] = np.asarray(polygon, dtype=float)
+            self.next_id += 1
+        self.compact()
+
+    def compact(self):
+        # Pelna przebudowa z zywych wielokatow - numery wielokatow zostaja te same
+        ids = list(self.polygons)
+        self.root = BSPNode([self.polygons[i] for i in ids], ids, **self.build_options)
+        self.holders = {i: [] for i in ids}
+        self.node_count = 0
+        self.dead_nodes = 0
+        self.depth = 0
+        stack = [(self.root, 1)]
+        while stack:
+            node, level = stack.pop()
+            self.node_count += 1
+            self.depth = max(self.depth, level)
+            if not node.polygons and node.plane is not None:
+                self.dead_nodes += 1
+            for polygon_id in set(node.polygon_ids):
+                self.holders[polygon_id].append(node)
+            stack.extend((child, level + 1) for child in (node.front, node.back) if child)
+        # Glebokosc tuz po budowie - punkt odniesienia, bo niektore sceny (np. rownolegle sciany)
+        # daja glebokie drzewo niezaleznie od budowy
+        self.built_depth = self.depth
+
+    def insert(self, polygon):
+        # Wstaw wielokat do istniejacego drzewa, dzielac go na plaszczyznach po drodze; zwraca jego numer
+        polygon_id = self.next_id
+        self.next_id += 1
+        points = np.asarray(polygon, dtype=float)
+        self.polygons[polygon_id] = points
+        holders = self.holders[polygon_id] = []
+
+        pending = [(self.root, points, 1)]
+        while pending:
+            node, piece, level = pending.pop()
+            if node.plane is None:
+                # Nowy lisc (albo puste drzewo) - plaszczyzna z samego kawalka
+                self.add_piece(node, piece, polygon_id)
+                node.plane = polygon_plane(piece)
+                self.depth = max(self.depth, level)
+                continue
+
+            distances = node.plane.signed_distances(piece)
+            side = int(np.bitwise_or.reduce(vertex_sides(distances)))
+            if side == COPLANAR:
+                self.add_piece(node, piece, polygon_id)
+            elif side == SPANNING:
+                front_piece, back_piece = node.plane.split_polygon(piece, distances)
+                if front_piece is not None:
+                    pending.append((self.descend(node, FRONT), front_piece, level + 1))
+                if back_piece is not None:
+                    pending.append((self.descend(node, BACK), back_piece, level + 1))
+            else:
+                pending.append((self.descend(node, side), piece, level + 1))
+
+        self.compact_if_degraded()
+        return polygon_id
+
+    def descend(self, node, side):
+        # Dziecko po danej stronie - brakujace tworzone jako pusty wezel bez plaszczyzny
+        child = node.front if side == FRONT else node.back
+        if child is None:
+            child = node.child()
+            if side == FRONT:
+                node.front = child
+            else:
+                node.back = child
+            self.node_count += 1
+        return child
+
+    def add_piece(self, node, piece, polygon_id):
+        # Martwy wezel (plaszczyzna bez wielokatow) znow zyje
+        if not node.polygons and node.plane is not None:
+            self.dead_nodes -= 1
+        node.polygons.append(piece)
+        node.polygon_ids.append(polygon_id)
+        if not self.holders[polygon_id] or self.holders[polygon_id][-1] is not node:
+            self.holders[polygon_id].append(node)
+
+    def remove(self, polygon_id):
+        # Usun wszystkie kawalki wielokata z wezlow, ktore je trzymaja - plaszczyzny zostaja
+        del self.polygons[polygon_id]
+        for node in self.holders.pop(polygon_id):
+            keep = [i for i, owner in enumerate(node.polygon_ids) if owner != polygon_id]
+            if len(keep) == len(node.polygon_ids):
+                continue
+            node.polygons = [node.polygons[i] for i in keep]
+            node.polygon_ids = [node.polygon_ids[i] for i in keep]
+            if not node.polygons:
+                self.dead_nodes += 1
+        self.compact_if_degraded()
+
+    def compact_if_degraded(self):
+        # Przebudowa, gdy za duzo wezlow jest martwych albo drzewo uroslo duzo glebsze niz po budowie
+        too_deep = self.depth > self.depth_factor * max(self.built_depth, np.log2(len(self.polygons) + 1))
+        if self.dead_nodes > self.max_dead_ratio * self.node_count or too_deep:
+            self.compact()
+
+
+class FlatBSP:
+    # Drzewo BSP splaszczone do tablic: plaszczyzny wezlow (N,4) jako [nx, ny, nz, -n.p],
+    # dzieci jako indeksy (-1 = brak), wielokaty wezla n to przedzial
+    # [node_polygons[n], node_polygons[n + 1]), a wierzcholki wielokata i to
+    # vertices[polygon_starts[i]:polygon_starts[i + 1]]. W obrebie wezla najpierw sa wielokaty
+    # zwrocone tak jak plaszczyzna wezla, od node_split[n] - zwrocone przeciwnie
+    def __init__(self, planes, front, back, node_polygons, vertices, polygon_starts, polygon_ids):
+        self.planes = planes
+        self.front = front
+        self.back = back
+        self.node_polygons = node_polygons
+        self.vertices = vertices
+        self.polygon_starts = polygon_starts
+        self.polygon_ids = polygon_ids
+        # Listy Pythona do petli przejscia - indeksowanie listy jest duzo szybsze niz tablicy numpy
+        self.front_list = front.tolist()
+        self.back_list = back.tolist()
+
+        # Geometria jest statyczna - normalne i srodki wielokatow liczone raz
+        lengths = np.diff(polygon_starts)
+        starts = polygon_starts[:-1]
+        self.polygon_lengths = lengths
+        self.normals = polygon_normals(vertices, starts) if len(starts) else np.empty((0, 3))
+        self.centroids = (np.add.reduceat(vertices, starts, axis=0) / lengths[:, None] if len(starts)
+                          else np.empty((0, 3)))
+
+        # Podzial wielokatow wezla wg zwrotu - kamera po jednej stronie widzi tylko jedna grupe
+        owners = np.repeat(np.arange(len(planes)), np.diff(node_polygons))
+        aligned = np.einsum('ij,ij->i', self.normals, planes[owners, :3]) > 0
+        self.node_split = node_polygons[:-1] + np.bincount(owners[aligned], minlength=len(planes))
+
+        # AABB wielokatow i cale poddrzewa - do odrzucania poza ostroslupem widzenia
+        self.polygon_bounds = np.empty((len(starts), 2, 3))
+        if len(starts):
+            self.polygon_bounds[:, 0] = np.minimum.reduceat(vertices, starts, axis=0)
+            self.polygon_bounds[:, 1] = np.maximum.reduceat(vertices, starts, axis=0)
+        self.node_bounds = np.empty((len(planes), 2, 3))
+        self.node_bounds[:, 0] = np.inf
+        self.node_bounds[:, 1] = -np.inf
+        np.minimum.at(self.node_bounds[:, 0], owners, self.polygon_bounds[:, 0])
+        np.maximum.at(self.node_bounds[:, 1], owners, self.polygon_bounds[:, 1])
+        # Poddrzewa poziomami od najglebszego - kazdy poziom naraz, petla tylko po glebokosci drzewa
+        for parents, children in reversed(self.tree_levels()):
+            np.minimum.at(self.node_bounds[:, 0], parents, self.node_bounds[children, 0])
+            np.maximum.at(self.node_bounds[:, 1], parents, self.node_bounds[children, 1])
+
+    def tree_levels(self):
+        # Kolejne poziomy drzewa jako pary (rodzice, dzieci) - rodzic powtorzony dla kazdego dziecka
+        levels = []
+        nodes = np.arange(min(len(self.planes), 1))
+        while len(nodes):
+            parents = np.concatenate((nodes, nodes))
+            children = np.concatenate((self.front[nodes], self.back[nodes]))
+            parents, children = parents[children >= 0], children[children >= 0]
+            if len(children):
+                levels.append((parents, children))
+            nodes = children
+        return levels
+
+    @staticmethod
+    def from_node(root):
+        # Numeracja wezlow w kolejnosci pre-order, wielokaty ukladane w tej samej kolejnosci
+        nodes = []
+        stack = [root] if root.plane is not None else []
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(child for child in (node.back, node.front) if child)
+        index = {id(node): i for i, node in enumerate(nodes)}
+
+        planes = np.empty((len(nodes), 4))
+        front = np.full(len(nodes), -1, dtype=np.int32)
+        back = np.full(len(nodes), -1, dtype=np.int32)
+        node_polygons = np.zeros(len(nodes) + 1, dtype=np.int32)
+        vertices = []
+        polygon_starts = [0]
+        polygon_ids = []
+        for i, node in enumerate(nodes):
+            planes[i, :3] = node.plane.normal
+            planes[i, 3] = -node.plane.offset
+            if node.front:
+                front[i] = index[id(node.front)]
+            if node.back:
+                back[i] = index[id(node.back)]
+            for poly in node.polygons:
+                vertices.append(poly)
+                polygon_starts.append(polygon_starts[-1] + len(poly))
+            polygon_ids.extend(node.polygon_ids)
+            node_polygons[i + 1] = len(polygon_ids)
+
+        vertices = np.concatenate(vertices) if vertices else np.empty((0, 3))
+        polygon_starts = np.array(polygon_starts, dtype=np.int64)
+        polygon_ids = np.array(polygon_ids, dtype=np.int32)
+
+        # W kazdym wezle najpierw wielokaty zwrocone zgodnie z plaszczyzna wezla, potem przeciwnie
+        owners = np.repeat(np.arange(len(nodes)), np.diff(node_polygons))
+        if len(owners):
+            normals = polygon_normals(vertices, polygon_starts[:-1])
+            opposite = np.einsum('ij,ij->i', normals, planes[owners, :3]) <= 0
+            order = np.lexsort((opposite, owners))
+            lengths = np.diff(polygon_starts)[order]
+            vertices = vertices[gather_ranges(polygon_starts[:-1][order], polygon_starts[1:][order])]
+            polygon_starts = np.concatenate(([0], np.cumsum(lengths)))
+            polygon_ids = polygon_ids[order]
+
+        return FlatBSP(planes, front, back, node_polygons, np.asarray(vertices, dtype=float),
+                       polygon_starts, polygon_ids)
+
+    def polygon_vertex_ids(self, polygons):
+        # Numery wierzcholkow podanych wielokatow po kolei + dlugosci tych wielokatow
+        starts = self.polygon_starts[polygons]
+        return gather_ranges(starts, self.polygon_starts[polygons + 1]), self.polygon_lengths[polygons]
+
+    def get_visible_polygons(self, camera_position):
+        # Numery wielokatow od najdalszego do najblizszego kamerze
+        # Strona kamery wzgledem wszystkich plaszczyzn liczona naraz; COPLANAR liczy sie jak FRONT
+        nodes = self.node_order(self.camera_sides(camera_position))
+        return gather_ranges(self.node_polygons[nodes], self.node_polygons[nodes + 1])
+
+    def camera_sides(self, camera_position):
+        # Strona kamery wzgledem plaszczyzn wszystkich wezlow jako FRONT/BACK/COPLANAR
+        return vertex_sides(self.planes[:, :3] @ camera_position + self.planes[:, 3])
+
+    def node_order(self, sides, outside=None):
+        # Wezly od najdalszego do najblizszego; outside - maska poddrzew do pominiecia
+        front, back = self.front_list, self.back_list
+        in_front = (sides != BACK).tolist()
+        outside = outside.tolist() if outside is not None else [False] * len(self.planes)
+
+        # Przejscie in-order bez rekurencji - ~n na stosie oznacza "wypisz wezel n"
+        order = []
+        stack = [0] if len(self.planes) and not outside[0] else []
+        while stack:
+            node = stack.pop()
+            if node < 0:
+                order.append(~node)
+                continue
+            near, far = (front[node], back[node]) if in_front[node] else (back[node], front[node])
+            if near >= 0 and not outside[near]:
+                stack.append(near)
+            stack.append(~node)
+            if far >= 0 and not outside[far]:
+                stack.append(far)
+        return np.array(order, dtype=np.int64)
+
+    def drawable_in_order(self, nodes, sides, frustum_normals, frustum_offsets):
+        # Z wezli w kolejnosci malowania wybierz wielokaty, ktore moga byc widoczne:
+        # tylko grupe zwrocona do kamery (kamera na plaszczyznie widzi wezel krawedzia - zadnej)
+        # i tylko te w ostroslupie widzenia
+        node_sides = sides[nodes]
+        starts = np.where(node_sides == FRONT, self.node_polygons[nodes], self.node_split[nodes])
+        ends = np.where(node_sides == FRONT, self.node_split[nodes], self.node_polygons[nodes + 1])
+        ends = np.where(node_sides == COPLANAR, starts, ends)
+        polygons = gather_ranges(starts, ends)
+        return polygons[boxes_in_frustum(self.polygon_bounds[polygons], frustum_normals, frustum_offsets)]
+
+    def get_drawable_polygons(self, camera_position, frustum_normals, frustum_offsets):
+        # Jak get_visible_polygons, ale od razu bez tego, czego nie da sie zobaczyc - poddrzewa,
+        # ktorych AABB jest w calosci poza ostroslupem, nie sa w ogole odwiedzane
+        sides = self.camera_sides(camera_position)
+        outside = classify_boxes(self.node_bounds, frustum_normals, frustum_offsets)[0]
+        nodes = self.node_order(sides, outside)
+        return self.drawable_in_order(nodes, sides, frustum_normals, frustum_offsets)
+
+
+class TraversalCache:
+    # Pamiec ostatniej kolejnosci wezlow FlatBSP. Kolejnosc zalezy tylko od tego, po ktorej
+    # stronie kazdej plaszczyzny jest kamera, wiec obroty i male ruchy jej nie zmieniaja.
+    # Plaszczyzne moze przeciac tylko ruch dluzszy niz odleglosc kamery od niej, wiec
+    # sprawdzane sa tylko plaszczyzny blizsze niz droga przebyta od ostatniego przeliczenia.
+    def __init__(self, tree):
+        self.tree = tree
+        self.nodes = None
+        self.reused = 0
+        self.rebuilt = 0
+
+    def refresh(self, camera_position):
+        tree = self.tree
+        distances = tree.planes[:, :3] @ camera_position + tree.planes[:, 3]
+        self.sides = vertex_sides(distances)
+        self.nodes = tree.node_order(self.sides)
+        self.by_distance = np.argsort(np.abs(distances))
+        self.sorted_distances = np.abs(distances)[self.by_distance]
+        self.position = np.array(camera_position, dtype=float)
+        self.path = 0.0
+        self.rebuilt += 1
+
+    def is_valid(self, camera_position):
+        self.path += float(np.linalg.norm(camera_position - self.position))
+        self.position = np.array(camera_position, dtype=float)
+        # Dopiero plaszczyzny blizej niz przebyta droga (+ tolerancja COPLANAR) mogly zmienic strone
+        count = np.searchsorted(self.sorted_distances, self.path + 2e-6, side='right')
+        near = self.by_distance[:count]
+        planes = self.tree.planes[near]
+        sides = vertex_sides(planes[:, :3] @ camera_position + planes[:, 3])
+        return np.array_equal(sides, self.sides[near])
+
+    def get_drawable_polygons(self, camera_position, frustum_normals, frustum_offsets):
+        camera = np.asarray(camera_position, dtype=float)
+        if self.nodes is not None and self.is_valid(camera):
+            self.reused += 1
+        else:
+            self.refresh(camera)
+
+        # Wezel poza ostroslupem to takze cale jego poddrzewo (pudelka sa zagniezdzone),
+        # wiec filtr na gotowej kolejnosci daje to samo co przyciete przejscie
+        tree = self.tree
+        outside = classify_boxes(tree.node_bounds[self.nodes], frustum_normals, frustum_offsets)[0]
+        nodes = self.nodes[~outside]
+        return tree.drawable_in_order(nodes, self.sides, frustum_normals, frustum_offsets)
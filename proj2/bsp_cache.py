@@ -0,0 +1,57 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from bsp import BSPNode, FlatBSP
+from scene import load_scene, scene_path
+
+# Zmiana formatu zapisu albo algorytmu budowy musi uniewaznic stare wpisy
+CACHE_VERSION = 1
+
+
+def cache_key(scene_prefix, build_options):
+    # Skrot tresci plikow sceny, z ktorych budowane jest drzewo, i parametrow budowy
+    digest = hashlib.sha256()
+    digest.update(json.dumps({'version': CACHE_VERSION, **build_options}, sort_keys=True).encode())
+    for name in ('vertices', 'faces'):
+        with open(scene_path(scene_prefix, name), 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_flat_bsp(path, tree):
+    # Zapis przez plik tymczasowy - przerwany zapis nie zostawi uszkodzonego wpisu
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        np.savez(f, planes=tree.planes, front=tree.front, back=tree.back, node_polygons=tree.node_polygons,
+                 vertices=tree.vertices, polygon_starts=tree.polygon_starts, polygon_ids=tree.polygon_ids)
+    os.replace(temporary, path)
+
+
+def load_flat_bsp(path):
+    with np.load(path) as data:
+        return FlatBSP(data['planes'], data['front'], data['back'], data['node_polygons'], data['vertices'],
+                       data['polygon_starts'], data['polygon_ids'])
+
+
+def load_or_build_bsp(scene_prefix, cache_dir='.bsp_cache', workers=None, progress=None, cancel=None,
+                      **build_options):
+    # Drzewo z pamieci podrecznej na dysku, jesli scena i parametry budowy sie nie zmienily;
+    # inny klucz to inny plik, wiec nieaktualne wpisy po prostu nie sa juz uzywane.
+    # workers, progress i cancel nie wchodza do klucza - nie zmieniaja wyniku budowy.
+    # Sciany sceny wczytywane dopiero przy braku wpisu - trafienie czyta tylko skrot plikow i .npz
+    path = os.path.join(cache_dir, f'bsp_{cache_key(scene_prefix, build_options)}.npz')
+    if os.path.exists(path):
+        try:
+            return load_flat_bsp(path)
+        except (OSError, ValueError, KeyError):
+            pass  # uszkodzony wpis - zbuduj od nowa i nadpisz
+
+    polygons = load_scene(scene_prefix).face_points()
+    tree = FlatBSP.from_node(BSPNode(polygons, workers=workers, progress=progress, cancel=cancel, **build_options))
+    os.makedirs(cache_dir, exist_ok=True)
+    save_flat_bsp(path, tree)
+    return tree
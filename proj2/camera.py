@@ -1,204 +1,59 @@
-import json
+import os
+import threading
+import time
 import tkinter as tk
 
 import numpy as np
 
+from bsp import BuildCancelled, TraversalCache, lengths_to_starts
+from bsp_cache import load_or_build_bsp
+from canvas_pool import CanvasItemPool
+from culling import frustum_planes
+from framebuffer import CanvasImage
+from lod import FULL, POINT, SILHOUETTE, projected_size, select_lod, unique_pixels
+from rasterizer import ZBufferRenderer
+from scene import load_instanced_scene
+from spatial_index import BVH
 
-class Plane:
-    def __init__(self, point, normal):
-        self.point = np.array(point)
-        self.normal = np.array(normal)
-
-        self.normal = self.normal / np.linalg.norm(self.normal)
-
-    def classify_point(self, point):
-        # Oblicz iloczyn skalarny zeby wiedziec z ktorej strony plaszczyzny jest punkt
-        v = np.array(point) - self.point
-        dot = np.dot(v, self.normal)
-
-        if dot > 1e-6:
-            return "FRONT"
-        elif dot < -1e-6:
-            return "BACK"
-        else:
-            return "COPLANAR"
-
-    def classify_polygon(self, polygon):
-        # Gdzie lezy wielokat wzgledem plaszczyzny
-        front_count = 0
-        back_count = 0
-
-        for point in polygon:
-            classification = self.classify_point(point)
-            if classification == "FRONT":
-                front_count += 1
-            elif classification == "BACK":
-                back_count += 1
-
-        if front_count > 0 and back_count == 0:
-            return "FRONT"
-        elif back_count > 0 and front_count == 0:
-            return "BACK"
-        elif front_count == 0 and back_count == 0:
-            return "COPLANAR"
-        else:
-            return "SPANNING"
-
-    def split_polygon(self, polygon):
-        # Podziel wielokat przez plaszczyzne
-        # Zwraca front_poly, back_poly
-        front_points = []
-        back_points = []
-
-        # Dodaj kazdy punkt do odpowiedniej listy
-        for i in range(len(polygon)):
-            current = polygon[i]
-            next_point = polygon[(i + 1) % len(polygon)]
-
-            current_classification = self.classify_point(current)
-            next_classification = self.classify_point(next_point)
-
-            if current_classification == "FRONT" or current_classification == "COPLANAR":
-                front_points.append(current)
-            if current_classification == "BACK" or current_classification == "COPLANAR":
-                back_points.append(current)
-
-            # Jesli krawedz przecina plaszczyzne, stworz punkt przeciecia i dodaj do obu stron
-            if (current_classification == "FRONT" and next_classification == "BACK") or \
-                    (current_classification == "BACK" and next_classification == "FRONT"):
-                current_array = np.array(current)
-                next_array = np.array(next_point)
-                direction = next_array - current_array
-
-                # Oblicz punkt przeciecia
-                t = np.dot(self.point - current_array, self.normal) / np.dot(direction, self.normal)
-                intersection = current_array + t * direction
-
-                # Dodaj przeciecie do obu stron
-                front_points.append(tuple(intersection))
-                back_points.append(tuple(intersection))
-
-        return front_points if len(front_points) >= 3 else None, back_points if len(back_points) >= 3 else None
-
-
-class BSPNode:
-    def __init__(self, polygons=None):
-        self.plane = None
-        self.front = None
-        self.back = None
-        self.polygons = []
-
-        if polygons:
-            self.build(polygons)
-
-    def build(self, polygons):
-        if not polygons:
-            return
-
-        # Wez pierwszy wielokat zeby zdefiniowac plaszczyzne podzialu
-        first_poly = polygons[0]
-        # Wez trzy punkty z wielokata, zeby ogarnac plaszczyzne
-        p1, p2, p3 = first_poly[0], first_poly[1], first_poly[2]
-
-        # Oblicz wektor normalny przez iloczyn wektorowy
-        v1 = np.array(p2) - np.array(p1)
-        v2 = np.array(p3) - np.array(p1)
-        normal = np.cross(v1, v2)
-
-        # Stworz plaszczyzne podzialu
-        self.plane = Plane(p1, normal)
-
-        # Podziel wielokaty na front, back i coplanar
-        front_list = []
-        back_list = []
-
-        for poly in polygons:
-            classification = self.plane.classify_polygon(poly)
-
-            if classification == "FRONT":
-                front_list.append(poly)
-            elif classification == "BACK":
-                back_list.append(poly)
-            elif classification == "COPLANAR":
-                # Dodaj do wielokatow tego wezla
-                self.polygons.append(poly)
-            elif classification == "SPANNING":
-                # Podziel wielokat i dodaj do obu stron
-                front_poly, back_poly = self.plane.split_polygon(poly)
-                if front_poly:
-                    front_list.append(front_poly)
-                if back_poly:
-                    back_list.append(back_poly)
-
-        # Zbuduj rekurencyjnie poddrzewa
-        if front_list:
-            self.front = BSPNode(front_list)
-        if back_list:
-            self.back = BSPNode(back_list)
-
-    def get_visible_polygons(self, camera_position):
-        result = []
-
-        # Jesli nie ma plaszczyzny, to jest lisc w drzewie
-        if not self.plane:
-            return self.polygons
-
-        # Sprawdz po ktorej stronie plaszczyzny jest kamera
-        camera_side = self.plane.classify_point(camera_position)
-
-        # Przejdz drzewo w odpowiedniej kolejnosci w zaleznosci od pozycji kamery
-        if camera_side == "FRONT" or camera_side == "COPLANAR":
-            # Kamera jest z przodu lub na plaszczyznie
-            # Najpierw przerob tyl (dalej od kamery)
-            if self.back:
-                result.extend(self.back.get_visible_polygons(camera_position))
-
-            # Dodaj wielokaty tego wezla
-            result.extend(self.polygons)
-
-            # Potem przerob przod (blizej kamery)
-            if self.front:
-                result.extend(self.front.get_visible_polygons(camera_position))
-        else:
-            # Kamera jest z tylu
-            # Przerob przod najpierw
-            if self.front:
-                result.extend(self.front.get_visible_polygons(camera_position))
-
-            # Dodaj wielokaty tego wezla
-            result.extend(self.polygons)
-
-            # Potem przerob tyl
-            if self.back:
-                result.extend(self.back.get_visible_polygons(camera_position))
-
-        return result
+# Po ilu ms KeyRelease bez KeyPress tego samego klawisza klawisz uznawany jest za puszczony
+RELEASE_DELAY_MS = 30
+# Ile sekund zamkniecie okna czeka, az przerwana budowa BSP zwolni procesy robocze
+CLOSE_TIMEOUT_S = 1.0
 
 
 class CameraApp:
-    def __init__(self, root):
+    def __init__(self, root, target_fps=60):
         self.root = root
         self.canvas = tk.Canvas(root, width=800, height=600)
         self.canvas.pack()
 
         # config kamery
         self.position = np.array([3.0, 3.0, -10.0])
-        self.move_speed = 0.5
-        self.rotation_speed = 0.05
+        self.move_speed = 5.0  # jednostki na sekunde
+        self.rotation_speed = 1.0  # radiany na sekunde
+        self.zoom_speed = 2.0  # mnoznik ogniskowej na sekunde
         self.focal_length = 500
         self.rotation_matrix = np.identity(3)
 
-        with open('cube_polygons.json') as f:
-            self.polygons = json.load(f)
-            self.polygons = [[tuple(point) for point in polygon] for polygon in self.polygons]
-
-        # Wczytaj krawedzie do wyswietlania bez BSP
-        with open('cube_data.json') as f:
-            data = json.load(f)
-        self.cube_data = [(tuple(p1), tuple(p2)) for p1, p2 in data]
-
-        # Zbuduj drzewo BSP
-        self.bsp_tree = BSPNode(self.polygons)
+        # Szesciany jako kopie jednego szablonu - widok krawedzi i bufor glebokosci. Drzewo BSP
+        # budowane z jawnych scian sceny cube_scene, wczytywanych dopiero, gdy nie ma go na dysku
+        self.instances = load_instanced_scene('cube_instances')
+
+        # indeks przestrzenny szescianow do widoku bez BSP - budowany raz
+        # (widok BSP odrzuca geometrie po pudelkach poddrzew samego drzewa)
+        self.cube_index = BVH(self.instances.cube_bounds)
+
+        # Drzewo BSP budowane w tle - do tego czasu widok krawedzi bez BSP
+        self.bsp_tree = None
+        self.bsp_order = None
+        self.bsp_progress = 0.0
+        self.bsp_ready = False
+        # wyjatek z watku budowania - wtedy zostaje widok krawedzi, a HUD pokazuje blad
+        self.bsp_error = None
+        self.bsp_thread = threading.Thread(target=self.build_bsp, daemon=True)
+        # ustawiane przy zamknieciu okna - budowa przerywa sie i nie czeka na reszte poddrzew
+        self.bsp_cancel = threading.Event()
+        self.root.protocol('WM_DELETE_WINDOW', self.on_close)
 
         grid_center = np.array([4.0, 4.0, 4.0])
         direction = grid_center - self.position
@@ -216,29 +71,176 @@ class CameraApp:
         ])
         self.rotation_matrix = self.rotation_matrix @ yaw_180
 
-        self.root.bind('<w>', lambda e: self.move_forward())
-        self.root.bind('<s>', lambda e: self.move_backward())
-        self.root.bind('<a>', lambda e: self.move_left())
-        self.root.bind('<d>', lambda e: self.move_right())
-        self.root.bind('<Up>', lambda e: self.look_up())
-        self.root.bind('<Down>', lambda e: self.look_down())
-        self.root.bind('<Left>', lambda e: self.turn_left())
-        self.root.bind('<Right>', lambda e: self.turn_right())
-        self.root.bind('<q>', lambda e: self.move_up())
-        self.root.bind('<e>', lambda e: self.move_down())
-        self.root.bind('<f>', lambda e: self.roll_clockwise())
-        self.root.bind('<g>', lambda e: self.roll_counter_clockwise())
-        self.root.bind('<h>', lambda e: self.zoom_in())
-        self.root.bind('<j>', lambda e: self.zoom_out())
-        self.root.bind('<b>', lambda e: self.toggle_bsp())
-
-        self.use_bsp = True
+        # klawisz -> akcja wykonywana co klatke, dopoki klawisz jest wcisniety
+        self.key_actions = {
+            'w': self.move_forward,
+            's': self.move_backward,
+            'a': self.move_left,
+            'd': self.move_right,
+            'up': self.look_up,
+            'down': self.look_down,
+            'left': self.turn_left,
+            'right': self.turn_right,
+            'q': self.move_up,
+            'e': self.move_down,
+            'f': self.roll_clockwise,
+            'g': self.roll_counter_clockwise,
+            'h': self.zoom_in,
+            'j': self.zoom_out,
+        }
+        # klawisz -> akcja wykonywana raz na wcisniecie
+        self.key_toggles = {
+            'b': self.toggle_bsp,
+            'z': self.toggle_zbuffer,
+            'p': self.toggle_blit,
+            'c': self.capture,
+            'o': self.toggle_lod,
+        }
+        self.pressed_keys = set()
+        # klawisz -> zaplanowane puszczenie (after); autorepeat X11 to pary KeyRelease + KeyPress,
+        # wiec puszczenie czeka chwile i KeyPress tego samego klawisza je odwoluje
+        self.pending_releases = {}
+        self.root.bind('<KeyPress>', self.on_key_press)
+        self.root.bind('<KeyRelease>', self.on_key_release)
+        self.root.bind('<FocusOut>', self.on_focus_out)
+
+        # petla klatek - zmiany z klawiszy zbierane i rysowane najwyzej raz na klatke
+        self.frame_interval = 1.0 / target_fps
+        self.dirty = True
+        self.last_tick = time.perf_counter()
+
+        self.use_bsp = False
+        # Z - zamiast elementow canvasa programowy rasterizer z buforem glebokosci
+        self.use_zbuffer = False
+        # P - klatka rasteryzowana do bufora i pokazana jednym obrazem zamiast elementu na wielokat
+        self.use_blit = False
+        # O - dalekie szesciany jako kontur albo punkt (poziom szczegolowosci wg rozmiaru na ekranie);
+        # widok BSP rysuje wielokaty drzewa, wiec zawsze pelna geometria
+        self.use_lod = True
+        self.captured = 0
+
+        # bufory na rzutowane punkty - powiekszane tylko gdy trzeba
+        self._rotated = np.empty((0, 3))
+        self._screen = np.empty((0, 2))
+        self._visible = np.empty(0, dtype=bool)
+
+        # elementy canvasa tworzone raz i przesuwane w kolejnych klatkach
+        gray_value = 200
+        color = f'#{gray_value:02x}{gray_value:02x}{gray_value:02x}'
+        self.polygon_pool = CanvasItemPool(self.canvas, 'polygon', 'scene', fill=color, outline='black')
+        self.edge_pool = CanvasItemPool(self.canvas, 'line', 'scene', fill='black')
+
+        # Bufor klatki (z buforem glebokosci) pokazywany jako jeden element canvasa pod tekstem
+        self.frame = ZBufferRenderer(800, 600)
+        self.frame_image = CanvasImage(self.canvas, 800, 600, 'scene')
+
         self.draw_controls()
         self.redraw()
+        self.dirty = False
+        # Watek budowy dopiero po pierwszej klatce - przygotowanie scian trzyma GIL, wiec pierwsza
+        # klatka nie czeka na nic, co zalezy od rozmiaru sceny
+        self.root.after(0, self.bsp_thread.start)
+        self.root.after(int(self.frame_interval * 1000), self.tick)
+
+    def build_bsp(self):
+        # Watek w tle - nie dotyka Tk, tylko ustawia pola, ktore tick() sprawdza co klatke
+        try:
+            # Zbuduj drzewo BSP i splaszcz je do tablic - przejscie w kazdej klatce idzie po tablicach
+            # Gotowe drzewo jest zapisywane na dysku i wczytywane przy kolejnym starcie z ta sama scena
+            tree = load_or_build_bsp('cube_scene', workers=os.cpu_count(), progress=self.on_bsp_progress,
+                                     cancel=self.bsp_cancel, splitter='axis')
+        except BuildCancelled:
+            return
+        except Exception as error:
+            # wyjatek w watku przepadlby bez sladu - tick() pokaze go w HUD
+            self.bsp_error = error
+            return
+        # kolejnosc malowania przeliczana tylko, gdy kamera przejdzie przez ktoras plaszczyzne
+        self.bsp_order = TraversalCache(tree)
+        self.bsp_tree = tree
+
+    def on_bsp_progress(self, done, waiting):
+        self.bsp_progress = done / max(1, done + waiting)
+
+    def on_close(self):
+        # Bez tego wyjscie z programu czekaloby na procesy robocze az do konca budowy
+        self.bsp_cancel.set()
+        if self.bsp_thread.is_alive():
+            self.bsp_thread.join(CLOSE_TIMEOUT_S)
+        self.root.destroy()
 
     def toggle_bsp(self):
+        # Dopoki drzewo sie buduje, zostaje widok krawedzi
+        if not self.bsp_ready:
+            return
         self.use_bsp = not self.use_bsp
-        self.redraw()
+        self.dirty = True
+
+    def toggle_zbuffer(self):
+        self.use_zbuffer = not self.use_zbuffer
+        self.dirty = True
+
+    def toggle_blit(self):
+        self.use_blit = not self.use_blit
+        self.dirty = True
+
+    def toggle_lod(self):
+        self.use_lod = not self.use_lod
+        self.dirty = True
+
+    def on_key_press(self, event):
+        key = event.keysym.lower()
+        pending = self.pending_releases.pop(key, None)
+        if pending is not None:
+            # KeyRelease tuz przed KeyPress - to autorepeat, klawisz caly czas wcisniety
+            self.root.after_cancel(pending)
+        # autorepeat wysyla kolejne KeyPress - akcje jednorazowe tylko przy pierwszym
+        if key in self.key_toggles and key not in self.pressed_keys:
+            self.key_toggles[key]()
+        self.pressed_keys.add(key)
+
+    def on_key_release(self, event):
+        key = event.keysym.lower()
+        if key not in self.pending_releases:
+            self.pending_releases[key] = self.root.after(RELEASE_DELAY_MS, self.release_key, key)
+
+    def release_key(self, key):
+        self.pending_releases.pop(key, None)
+        self.pressed_keys.discard(key)
+
+    def on_focus_out(self, event):
+        for pending in self.pending_releases.values():
+            self.root.after_cancel(pending)
+        self.pending_releases.clear()
+        self.pressed_keys.clear()
+
+    def tick(self):
+        now = time.perf_counter()
+        # po dlugiej przerwie (np. przeciaganie okna) nie przeskakuj kamera
+        dt = min(now - self.last_tick, 0.1)
+        self.last_tick = now
+
+        for key in self.pressed_keys:
+            action = self.key_actions.get(key)
+            if action:
+                action(dt)
+
+        # drzewo gotowe - przelacz na widok BSP
+        if not self.bsp_ready and self.bsp_tree is not None:
+            self.bsp_ready = True
+            self.use_bsp = True
+            self.dirty = True
+
+        # wszystkie zmiany z tej klatki - jedno przerysowanie, a bez zmian zadnego
+        if self.dirty:
+            self.redraw()
+            self.dirty = False
+        elif not self.bsp_ready:
+            self.update_status()
+
+        elapsed = time.perf_counter() - now
+        delay = max(1, int((self.frame_interval - elapsed) * 1000))
+        self.root.after(delay, self.tick)
 
     def get_view_vectors(self):
         right = self.rotation_matrix[:, 0]
@@ -246,85 +248,85 @@ class CameraApp:
         forward = -self.rotation_matrix[:, 2]
         return forward, right, up
 
-    def move_forward(self):
+    def move_forward(self, dt):
         forward, _, _ = self.get_view_vectors()
-        self.position -= forward * self.move_speed
-        self.redraw()
+        self.position -= forward * self.move_speed * dt
+        self.dirty = True
 
-    def move_backward(self):
+    def move_backward(self, dt):
         forward, _, _ = self.get_view_vectors()
-        self.position += forward * self.move_speed
-        self.redraw()
+        self.position += forward * self.move_speed * dt
+        self.dirty = True
 
-    def move_left(self):
+    def move_left(self, dt):
         _, right, _ = self.get_view_vectors()
-        self.position -= right * self.move_speed
-        self.redraw()
+        self.position -= right * self.move_speed * dt
+        self.dirty = True
 
-    def move_right(self):
+    def move_right(self, dt):
         _, right, _ = self.get_view_vectors()
-        self.position += right * self.move_speed
-        self.redraw()
+        self.position += right * self.move_speed * dt
+        self.dirty = True
 
-    def move_up(self):
+    def move_up(self, dt):
         _, _, up = self.get_view_vectors()
-        self.position += up * self.move_speed
-        self.redraw()
+        self.position += up * self.move_speed * dt
+        self.dirty = True
 
-    def move_down(self):
+    def move_down(self, dt):
         _, _, up = self.get_view_vectors()
-        self.position -= up * self.move_speed
-        self.redraw()
+        self.position -= up * self.move_speed * dt
+        self.dirty = True
 
-    def look_up(self):
-        theta = self.rotation_speed
+    def look_up(self, dt):
+        theta = self.rotation_speed * dt
         c, s = np.cos(theta), np.sin(theta)
         delta_R = np.array([[1, 0, 0], [0, c, s], [0, -s, c]])
         self.rotation_matrix = self.rotation_matrix @ delta_R
-        self.redraw()
+        self.dirty = True
 
-    def look_down(self):
-        theta = -self.rotation_speed
+    def look_down(self, dt):
+        theta = -self.rotation_speed * dt
         c, s = np.cos(theta), np.sin(theta)
         delta_R = np.array([[1, 0, 0], [0, c, s], [0, -s, c]])
         self.rotation_matrix = self.rotation_matrix @ delta_R
-        self.redraw()
+        self.dirty = True
 
-    def turn_left(self):
-        theta = self.rotation_speed
+    def turn_left(self, dt):
+        theta = self.rotation_speed * dt
         c, s = np.cos(theta), np.sin(theta)
         delta_R = np.array([[c, 0, -s], [0, 1, 0], [s, 0, c]])
         self.rotation_matrix = self.rotation_matrix @ delta_R
-        self.redraw()
+        self.dirty = True
 
-    def turn_right(self):
-        theta = -self.rotation_speed
+    def turn_right(self, dt):
+        theta = -self.rotation_speed * dt
         c, s = np.cos(theta), np.sin(theta)
         delta_R = np.array([[c, 0, -s], [0, 1, 0], [s, 0, c]])
         self.rotation_matrix = self.rotation_matrix @ delta_R
-        self.redraw()
+        self.dirty = True
 
-    def roll_clockwise(self):
-        theta = -self.rotation_speed
+    def roll_clockwise(self, dt):
+        theta = -self.rotation_speed * dt
         c, s = np.cos(theta), np.sin(theta)
         delta_R = np.array([[c, s, 0], [-s, c, 0], [0, 0, 1]])
         self.rotation_matrix = self.rotation_matrix @ delta_R
-        self.redraw()
+        self.dirty = True
 
-    def roll_counter_clockwise(self):
-        theta = self.rotation_speed
+    def roll_counter_clockwise(self, dt):
+        theta = self.rotation_speed * dt
         c, s = np.cos(theta), np.sin(theta)
         delta_R = np.array([[c, s, 0], [-s, c, 0], [0, 0, 1]])
         self.rotation_matrix = self.rotation_matrix @ delta_R
-        self.redraw()
+        self.dirty = True
 
-    def zoom_in(self):
-        self.focal_length *= 1.1
-        self.redraw()
+    def zoom_in(self, dt):
+        self.focal_length *= self.zoom_speed ** dt
+        self.dirty = True
 
-    def zoom_out(self):
-        self.focal_length /= 1.1
-        self.redraw()
+    def zoom_out(self, dt):
+        self.focal_length /= self.zoom_speed ** dt
+        self.dirty = True
 
     def project_point(self, point):
         translated = np.array(point) - self.position
@@ -336,68 +338,235 @@ class CameraApp:
         y_proj = (y / z) * self.focal_length
         return 400 + x_proj, 300 - y_proj
 
-    def calculate_polygon_normal(self, polygon):
-        if len(polygon) < 3:
-            return np.array([0, 0, 0])
-
-        # Oblicz wektor normalny dla wielokata
-        v1 = np.array(polygon[1]) - np.array(polygon[0])
-        v2 = np.array(polygon[2]) - np.array(polygon[0])
-        normal = np.cross(v1, v2)
-
-        return normal / np.linalg.norm(normal) if np.linalg.norm(normal) > 0 else normal
-
-    def is_polygon_facing_camera(self, polygon):
-        normal = self.calculate_polygon_normal(polygon)
-        centroid = np.mean([np.array(p) for p in polygon], axis=0)
-        view_vector = centroid - self.position
-
-        # Jesli iloczyn skalarny jest ujemny, wielokat jest skierowany w strone kamery
-        return np.dot(normal, view_vector) < 0
+    def project_points(self, points):
+        # Rzutowanie wielu punktow naraz: jedno mnozenie macierzy i jedno dzielenie
+        # Zwraca widoki na bufory (N,2) wspolrzednych ekranu i (N,) maske widocznosci
+        rotated = self.rotation_buffer(len(points))
+        # (R.T @ (p - pos)) dla kazdego wiersza to (p - pos) @ R
+        np.subtract(points, self.position, out=rotated)
+        np.matmul(rotated, self.rotation_matrix, out=rotated)
+        return self.perspective(len(points))
+
+    def project_instances(self, template, offsets):
+        # Kopie jednego szablonu: (t + o - pos) @ R = t @ R + (o - pos) @ R - szablon obracany raz,
+        # przesuniecia raz na kopie, a wierzcholki kopii to juz tylko dodawanie z broadcastem.
+        # Wierzcholek k kopii i ma numer i * len(template) + k
+        n = len(offsets) * len(template)
+        rotated = self.rotation_buffer(n).reshape(len(offsets), len(template), 3)
+        np.add(((offsets - self.position) @ self.rotation_matrix)[:, None, :], template @ self.rotation_matrix,
+               out=rotated)
+        return self.perspective(n)
+
+    def rotation_buffer(self, n):
+        # Bufory powiekszane tylko gdy trzeba - zwraca widok (n,3) na punkty w ukladzie kamery
+        if len(self._rotated) < n:
+            self._rotated = np.empty((n, 3))
+            self._screen = np.empty((n, 2))
+            self._visible = np.empty(n, dtype=bool)
+        return self._rotated[:n]
+
+    def perspective(self, n):
+        # Punkty z bufora _rotated (uklad kamery) na ekran
+        rotated = self._rotated[:n]
+        screen = self._screen[:n]
+        visible = self._visible[:n]
+        z = rotated[:, 2]
+        np.greater(z, 0, out=visible)  # punkty za kamera sa niewidoczne
+
+        # Punkty za kamera i tak sa odrzucane przez maske, wiec wystarczy nie dzielic przez zero
+        np.maximum(z, 1e-9, out=z)
+        np.divide(rotated[:, :2], z[:, None], out=screen)
+        screen *= self.focal_length
+        screen[:, 0] += 400
+        np.subtract(300, screen[:, 1], out=screen[:, 1])
+        return screen, visible
 
     def redraw(self):
-        self.canvas.delete("all")
-
-        if self.use_bsp:
-            # Uzyj drzewa BSP do eliminacji powierzchni zaslonietych
-            visible_polygons = self.bsp_tree.get_visible_polygons(tuple(self.position))
-
-            # Narysuj widoczne wielokaty
-            for poly in visible_polygons:
-                # Sprawdz, czy wielokat jest skierowany w strone kamery - inaczej go nie rysuj
-                if not self.is_polygon_facing_camera(poly):
-                    continue
-
-                points_2d = []
-                valid = True
-
-                for point in poly:
-                    proj = self.project_point(point)
-                    if not proj:
-                        valid = False
-                        break
-                    points_2d.append(proj)
-
-                if valid and len(points_2d) >= 3:
-                    flat_points = [coord for point in points_2d for coord in point]
-
-                    gray_value = 200
-
-                    color = f'#{gray_value:02x}{gray_value:02x}{gray_value:02x}'
-
-                    # Renderuj tylko w trybie solid - pelne wielokaty
-                    self.canvas.create_polygon(flat_points, fill=color, outline='black')
+        created = False
+        if self.use_zbuffer or self.use_blit:
+            # Cala klatka rasteryzowana do bufora i pokazana jako jeden obraz
+            self.render_frame()
+            self.frame_image.show(self.frame)
+            self.polygon_pool.hide()
+            self.edge_pool.hide()
+        elif self.use_bsp:
+            self.frame_image.hide()
+            screen, starts, lengths, valid, _ = self.bsp_polygons()
+
+            # Renderuj tylko w trybie solid - pelne wielokaty
+            coords = screen.ravel().tolist()
+            polygons_2d = [coords[2 * start:2 * (start + length)]
+                           for start, length, ok in zip(starts.tolist(), lengths.tolist(), valid.tolist()) if ok]
+
+            # Kolejnosc elementow puli to kolejnosc malowania - zachowuje porzadek z BSP
+            created = self.polygon_pool.update(polygons_2d)
+            self.edge_pool.hide()
         else:
-            # krawedzie bez BSP - tylko linie
-            for edge in self.cube_data:
-                p1 = self.project_point(edge[0])
-                p2 = self.project_point(edge[1])
-                if p1 and p2:
-                    self.canvas.create_line(p1[0], p1[1], p2[0], p2[1], fill='black')
-
-        self.draw_controls()
+            self.frame_image.hide()
+            created = self.edge_pool.update(self.wireframe_lines().tolist())
+            self.polygon_pool.hide()
+
+        if created:
+            # nowe elementy laduja na wierzchu stosu - tekst musi zostac nad nimi
+            self.canvas.tag_raise('hud')
+        self.update_status()
+
+    def bsp_polygons(self):
+        # Uzyj drzewa BSP do eliminacji powierzchni zaslonietych
+        tree = self.bsp_tree
+        # Tylko wielokaty w ostroslupie widzenia i zwrocone do kamery, w kolejnosci z pamieci,
+        # dopoki kamera nie przejdzie przez plaszczyzne podzialu
+        normals, offsets = frustum_planes(self.position, self.rotation_matrix, self.focal_length)
+        order = self.bsp_order.get_drawable_polygons(self.position, normals, offsets)
+
+        # Wszystkie wierzcholki pozostalych wielokatow rzutowane jednym wywolaniem
+        vertex_ids, lengths = tree.polygon_vertex_ids(order)
+        screen, visible = self.project_points(tree.vertices[vertex_ids])
+        starts = lengths_to_starts(lengths)
+        # Wielokat z choc jednym punktem za kamera jest pomijany
+        valid = np.logical_and.reduceat(visible, starts) if len(order) else np.empty(0, dtype=bool)
+        return screen, starts, lengths, valid, order
+
+    def visible_cubes(self):
+        # Przesuniecia szescianow w ostroslupie widzenia i poziom szczegolowosci kazdego z nich
+        normals, offsets = frustum_planes(self.position, self.rotation_matrix, self.focal_length)
+        cube_offsets = self.instances.offsets[self.cube_index.query_frustum(normals, offsets)]
+        if not self.use_lod:
+            return cube_offsets, np.full(len(cube_offsets), FULL, dtype=np.int8)
+        depth = (cube_offsets + self.instances.center - self.position) @ self.rotation_matrix[:, 2]
+        return cube_offsets, select_lod(depth, self.instances.radius, self.focal_length)
+
+    def wireframe_lines(self):
+        # krawedzie bez BSP - tylko linie, szesciany poza ostroslupem widzenia pomijane w calosci
+        instances = self.instances
+        cube_offsets, level = self.visible_cubes()
+
+        # Dalekie szesciany - tylko rzut srodka, po jednym punkcie na piksel
+        # (bufory rzutowania sa wspolne, wiec najpierw punkty, potem szablony)
+        screen, visible = self.project_points(cube_offsets[level == POINT] + instances.center)
+        points = unique_pixels(screen[visible], 800, 600)
+
+        # Blizsze - wszystkie krawedzie albo, w srednim zakresie, tylko kontur
+        near = level != POINT
+        cube_offsets, level = cube_offsets[near], level[near]
+        keep = np.ones((len(cube_offsets), len(instances.template_edges)), dtype=bool)
+        outline = level == SILHOUETTE
+        keep[outline] = instances.silhouette_edges(instances.front_faces(cube_offsets[outline], self.position))
+        screen, visible = self.project_instances(instances.template_vertices, cube_offsets)
+        edges = instances.edges_of_instances(len(cube_offsets))[keep.ravel()]
+        drawn = visible[edges[:, 0]] & visible[edges[:, 1]]
+        # punkt jako odcinek dlugosci piksela - Tk nie rysuje linii o zerowej dlugosci
+        return np.concatenate((screen[edges[drawn]].reshape(-1, 4), np.hstack((points, points + [1, 0]))))
+
+    def shade(self, normals, centroids):
+        # Cieniowanie od swiatla przy kamerze - w obrazie sciany sa rozroznialne bez obrysu
+        view = centroids - self.position
+        view /= np.linalg.norm(view, axis=1, keepdims=True)
+        facing = np.abs(np.einsum('ij,ij->i', normals, view))
+        shade = 200 * (0.4 + 0.6 * facing)
+        return np.repeat(shade[:, None], 3, axis=1).astype(np.uint8)
+
+    def render_frame(self):
+        # Biezacy widok do self.frame - ten sam bufor sluzy do wyswietlenia i do zapisu klatki
+        self.frame.clear()
+        if self.use_zbuffer:
+            self.render_zbuffer()
+        elif self.use_bsp:
+            # Malarz w kolejnosci z BSP - bez testu glebokosci
+            screen, starts, lengths, valid, order = self.bsp_polygons()
+            colors = self.shade(self.bsp_tree.normals[order], self.bsp_tree.centroids[order])
+            self.frame.draw_polygons_in_order(screen, starts[valid], lengths[valid], colors[valid])
+        else:
+            self.frame.draw_lines(self.wireframe_lines())
+
+    def render_zbuffer(self):
+        # Sciany szescianow w ostroslupie, zwrocone do kamery, rysowane z buforem glebokosci -
+        # kolejnosc nie ma znaczenia, wiec drzewo BSP nie jest potrzebne
+        instances = self.instances
+        cube_offsets, level = self.visible_cubes()
+
+        # Dalekie szesciany - wypelniony kwadrat wielkosci rzutu w glebokosci srodka
+        # (bufory rzutowania sa wspolne, wiec najpierw one, potem szablony)
+        far = cube_offsets[level == POINT]
+        screen, visible = self.project_points(far + instances.center)
+        depth = self._rotated[:len(far), 2][visible]
+        # bok szescianu to 2r / sqrt(3)
+        sides = np.ceil(projected_size(depth, instances.radius, self.focal_length) / np.sqrt(3))
+        self.frame.draw_squares(screen[visible], sides.astype(np.int64), depth, self.cube_colors(far[visible]))
+
+        near = level != POINT
+        cube_offsets, level = cube_offsets[near], level[near]
+        front = instances.front_faces(cube_offsets, self.position)
+        screen, visible = self.project_instances(instances.template_vertices, cube_offsets)
+        depth = self._rotated[:len(screen), 2]
+
+        # Blisko - sciany zwrocone do kamery
+        front_full = front & (level == FULL)[:, None]
+        faces = instances.faces_of_instances(len(cube_offsets))[front_full.ravel()]
+        # Sciana z choc jednym punktem za kamera jest pomijana, jak w widoku BSP
+        valid = np.all(visible[faces], axis=1)
+        faces = faces[valid]
+        copy_ids, face_ids = np.nonzero(front_full)
+        copy_ids, face_ids = copy_ids[valid], face_ids[valid]
+        face_colors = self.shade(instances.face_normals[face_ids],
+                                 instances.face_centroids[face_ids] + cube_offsets[copy_ids])
+
+        # Sredni zakres - caly szescian jednym wielokatem wypuklym o rogach na konturze
+        outline_ids, outline_lengths = self.outline_polygons(front, level == SILHOUETTE, screen, visible)
+        outline_colors = self.cube_colors(cube_offsets[level == SILHOUETTE][outline_lengths > 0])
+        outline_lengths = outline_lengths[outline_lengths > 0]
+
+        polygon_vertices = np.concatenate((faces.ravel(), outline_ids))
+        lengths = np.concatenate((np.full(len(faces), faces.shape[1]), outline_lengths))
+        self.frame.draw_polygons(screen[polygon_vertices], depth[polygon_vertices], lengths_to_starts(lengths),
+                                 lengths, np.concatenate((face_colors, outline_colors)))
+
+    def outline_polygons(self, front, selected, screen, visible):
+        # Kontur wybranych kopii jako wielokat: rogi na krawedziach konturu posortowane wg kata wokol
+        # ich srodka na ekranie (rzut bryly wypuklej jest wypukly). Zwraca numery wierzcholkow
+        # i dlugosc wielokata kazdej wybranej kopii - 0, gdy ktorys rog jest za kamera
+        instances = self.instances
+        corner_count = len(instances.template_vertices)
+        copies = np.flatnonzero(selected)
+        copy_ids, edge_ids = np.nonzero(instances.silhouette_edges(front[copies]))
+        on_outline = np.zeros((len(copies), corner_count), dtype=bool)
+        on_outline[copy_ids[:, None], instances.template_edges[edge_ids]] = True
+
+        owners, corners = np.nonzero(on_outline)
+        vertex_ids = copies[owners] * corner_count + corners
+        lengths = on_outline.sum(axis=1)
+        if not len(vertex_ids):
+            return vertex_ids, lengths
+        starts = lengths_to_starts(lengths)
+        points = screen[vertex_ids]
+        centers = np.add.reduceat(points, starts) / lengths[:, None]
+        relative = points - centers[owners]
+        order = np.lexsort((np.arctan2(relative[:, 1], relative[:, 0]), owners))
+        ok = np.logical_and.reduceat(visible[vertex_ids], starts)
+        vertex_ids, owners = vertex_ids[order], owners[order]
+        return vertex_ids[ok[owners]], np.where(ok, lengths, 0)
+
+    def cube_colors(self, cube_offsets):
+        # Jeden kolor na szescian (sredni i daleki zakres) - cieniowanie sciany najbardziej
+        # zwroconej do kamery
+        instances = self.instances
+        view = cube_offsets + instances.center - self.position
+        face_ids = np.argmin(view @ instances.face_normals.T, axis=1)
+        return self.shade(instances.face_normals[face_ids], instances.face_centroids[face_ids] + cube_offsets)
+
+    def capture(self, path=None):
+        # Zapisz biezacy widok do pliku PPM - niezaleznie od trybu wyswietlania
+        if path is None:
+            path = f'klatka_{self.captured:04d}.ppm'
+            self.captured += 1
+        self.render_frame()
+        self.frame.save(path)
+        # bufor jest wspolny z wyswietlaniem - w trybie obrazu trzeba go odtworzyc
+        self.dirty = True
+        return path
 
     def draw_controls(self):
+        # Tekst sterowania jest statyczny - rysowany tylko raz, status tylko aktualizowany
         controls = """Kontrolki:
         W/S - Ruch przód/tył
         A/D - Strafe lewo/prawo
@@ -405,12 +574,30 @@ class CameraApp:
         F/G - Obrót w osi Z
         Strzałki - Rozglądanie
         H/J - Przybliż/oddal
-        B - Przełącz BSP"""
-
-        bsp_status = "BSP: ON" if self.use_bsp else "BSP: OFF"
-
-        self.canvas.create_text(10, 10, text=controls, anchor='nw', fill='black')
-        self.canvas.create_text(400, 10, text=bsp_status, anchor='n', fill='blue')
+        B - Przełącz BSP
+        Z - Przełącz z-bufor
+        P - Przełącz obraz / elementy canvasa
+        C - Zapisz klatkę (PPM)
+        O - Przełącz poziom szczegółowości"""
+
+        self.canvas.create_text(10, 10, text=controls, anchor='nw', fill='black', tags='hud')
+        self.status_item = self.canvas.create_text(400, 10, text='', anchor='n', fill='blue', tags='hud')
+        self.status_text = None
+
+    def update_status(self):
+        if self.bsp_error is not None:
+            bsp_status = f"BSP: blad budowania ({type(self.bsp_error).__name__}: {self.bsp_error})"
+        elif not self.bsp_ready:
+            bsp_status = f"BSP: budowanie {self.bsp_progress:.0%}"
+        else:
+            bsp_status = "BSP: ON" if self.use_bsp else "BSP: OFF"
+        if self.use_zbuffer:
+            bsp_status += " | Z-bufor"
+        elif self.use_blit:
+            bsp_status += " | Obraz"
+        if bsp_status != self.status_text:
+            self.canvas.itemconfigure(self.status_item, text=bsp_status)
+            self.status_text = bsp_status
 
 
 if __name__ == "__main__":
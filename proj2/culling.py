@@ -0,0 +1,37 @@
+import numpy as np
+
+
+def frustum_planes(position, rotation_matrix, focal_length, half_width=400, half_height=300, near=1e-3):
+    # Plaszczyzny ostroslupa widzenia w ukladzie swiata jako (normalne (5,3), przesuniecia (5,))
+    # Punkt p jest wewnatrz, gdy normals @ p + offsets >= 0 dla kazdej plaszczyzny
+    # W ukladzie kamery punkt jest na ekranie, gdy |x / z * f| <= half_width i |y / z * f| <= half_height
+    f = focal_length
+    camera_normals = np.array([
+        [0.0, 0.0, 1.0],  # bliska: z >= near
+        [f, 0.0, half_width],  # lewa
+        [-f, 0.0, half_width],  # prawa
+        [0.0, f, half_height],  # dolna
+        [0.0, -f, half_height],  # gorna
+    ])
+    camera_offsets = np.array([-near, 0.0, 0.0, 0.0, 0.0])
+
+    # Kamera: c = R.T @ (p - pos), wiec n_c . c = (R @ n_c) . (p - pos)
+    normals = camera_normals @ rotation_matrix.T
+    offsets = camera_offsets - normals @ position
+    return normals, offsets
+
+
+def classify_boxes(bounds, normals, offsets):
+    # Test wszystkich AABB naraz - bounds (N,2,3) jako [min, max]
+    # Zwraca maski (w calosci poza, w calosci w srodku); pudelko jest poza, gdy lezy
+    # po zewnetrznej stronie ktorejkolwiek plaszczyzny
+    centers = (bounds[:, 0] + bounds[:, 1]) * 0.5
+    extents = (bounds[:, 1] - bounds[:, 0]) * 0.5
+    distances = centers @ normals.T + offsets
+    radii = extents @ np.abs(normals).T
+    return np.any(distances + radii < 0, axis=1), np.all(distances - radii >= 0, axis=1)
+
+
+def boxes_in_frustum(bounds, normals, offsets):
+    outside, _ = classify_boxes(bounds, normals, offsets)
+    return ~outside
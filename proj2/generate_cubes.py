@@ -1,104 +1,218 @@
+import itertools
 import json
-
-
-def save_cube_data(filename):
-    polygons = generate_cube_grid()
-
-    serializable = []
-    for polygon in polygons:
-        serializable.append([
-            [float(coord) for coord in point] for point in polygon
-        ])
-
+import sys
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from scene import SCENE_ARRAYS, InstancedScene, save_instanced_scene, scene_path
+from voxels import VoxelScene
+
+# Szablon jednego szescianu o boku 1 - rogi, krawedzie i sciany jako indeksy rogow
+CUBE_CORNERS = np.array([
+    [0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+    [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1],
+], dtype=float)
+CUBE_EDGES = np.array([
+    [0, 1], [1, 2], [2, 3], [3, 0],
+    [4, 5], [5, 6], [6, 7], [7, 4],
+    [0, 4], [1, 5], [2, 6], [3, 7],
+])
+CUBE_FACES = np.array([
+    [0, 3, 2, 1], [4, 5, 6, 7], [0, 1, 5, 4],
+    [1, 2, 6, 5], [2, 3, 7, 6], [3, 0, 4, 7],
+])
+# Ile szescianow generowac i zapisywac naraz - pamiec zalezy od tego, a nie od rozmiaru siatki
+CHUNK_CUBES = 1 << 16
+
+
+def grid_bases(first, last, size, spacing, cube_size):
+    # Narozniki szescianow o numerach [first, last) - kolejnosc jak w petlach x, y, z (z najszybciej)
+    ids = np.arange(first, last)
+    cells = np.stack((ids // (size * size), ids // size % size, ids % size), axis=1)
+    return cells * (cube_size + spacing)
+
+
+def cube_chunks(size, spacing, cube_size, chunk_cubes=CHUNK_CUBES):
+    # Kolejne paczki (numer pierwszego szescianu, narozniki) siatki size x size x size
+    count = size ** 3
+    for first in range(0, count, chunk_cubes):
+        yield first, grid_bases(first, min(first + chunk_cubes, count), size, spacing, cube_size)
+
+
+def cube_corners(bases, cube_size):
+    # Rogi szescianow (N,8,3)
+    return bases[:, None, :] + CUBE_CORNERS * cube_size
+
+
+def mesh_chunk(first, bases, cube_size):
+    # Tablice sceny dla paczki szescianow - numery wierzcholkow liczone od szescianu first
+    first_vertex = np.arange(first, first + len(bases))[:, None, None] * len(CUBE_CORNERS)
+    return {
+        'vertices': cube_corners(bases, cube_size).reshape(-1, 3),
+        'faces': (CUBE_FACES + first_vertex).reshape(-1, 4),
+    }
+
+
+def write_json_chunks(filename, chunks):
+    # Lista JSON pisana paczkami tablic - ten sam tekst co json.dump calej listy, bez budowania jej w pamieci
     with open(filename, 'w') as f:
-        json.dump(serializable, f)
-
-
-def generate_cube_grid():
-    size = 3
-    polygons = []
-    spacing = 1
-    cube_size = 1.2
-
-    for x in range(size):
-        for y in range(size):
-            for z in range(size):
-                base_x = x * (cube_size + spacing)
-                base_y = y * (cube_size + spacing)
-                base_z = z * (cube_size + spacing)
-
-                v0 = (base_x, base_y, base_z)
-                v1 = (base_x + cube_size, base_y, base_z)
-                v2 = (base_x + cube_size, base_y + cube_size, base_z)
-                v3 = (base_x, base_y + cube_size, base_z)
-                v4 = (base_x, base_y, base_z + cube_size)
-                v5 = (base_x + cube_size, base_y, base_z + cube_size)
-                v6 = (base_x + cube_size, base_y + cube_size, base_z + cube_size)
-                v7 = (base_x, base_y + cube_size, base_z + cube_size)
-
-                polygons.append([v0, v3, v2, v1])
-                polygons.append([v4, v5, v6, v7])
-                polygons.append([v0, v1, v5, v4])
-                polygons.append([v1, v2, v6, v5])
-                polygons.append([v2, v3, v7, v6])
-                polygons.append([v3, v0, v4, v7])
-
-    return polygons
-
-
-def generate_edges_from_polygons(polygons):
-    edges = set()
-
-    for poly in polygons:
-        for i in range(len(poly)):
-            v1 = poly[i]
-            v2 = poly[(i + 1) % len(poly)]
-
-            if v1 < v2:
-                edge = (v1, v2)
-            else:
-                edge = (v2, v1)
-
-            edges.add(edge)
-
-    return list(edges)
-
-
-def save_both_formats(filename_polygons, filename_edges):
-    polygons = generate_cube_grid()
-    edges = generate_edges_from_polygons(polygons)
-
-    serializable_polygons = []
-    for polygon in polygons:
-        serializable_polygons.append([
-            [float(coord) for coord in point] for point in polygon
-        ])
-
-    with open(filename_polygons, 'w') as f:
-        json.dump(serializable_polygons, f)
-
-    serializable_edges = []
-    for edge in edges:
-        serializable_edges.append([
-            [float(coord) for coord in edge[0]],
-            [float(coord) for coord in edge[1]]
-        ])
-
-    with open(filename_edges, 'w') as f:
-        json.dump(serializable_edges, f)
+        f.write('[')
+        separator = ''
+        for chunk in chunks:
+            if len(chunk):
+                f.write(separator + json.dumps(chunk.tolist())[1:-1])
+                separator = ', '
+        f.write(']')
+
+
+def save_cube_data(filename, size=3, spacing=1, cube_size=1.2, chunk_cubes=CHUNK_CUBES):
+    # Sciany jako listy punktow w JSON - pisane paczkami szescianow
+    write_json_chunks(filename, (cube_corners(bases, cube_size)[:, CUBE_FACES].reshape(-1, 4, 3)
+                                 for _, bases in cube_chunks(size, spacing, cube_size, chunk_cubes)))
+
+
+def save_scene_data(prefix, size=3, spacing=1, cube_size=1.2, chunk_cubes=CHUNK_CUBES):
+    # Scena zapisywana paczkami wprost do plikow .npy (open_memmap) - cala siatka nie musi miescic
+    # sie w pamieci, a plik jest od razu gotowy do wczytania przez load_scene.
+    # Liczba wierszy kazdej tablicy na jeden szescian - z szablonu pojedynczego szescianu
+    template = mesh_chunk(0, grid_bases(0, 1, size, spacing, cube_size), cube_size)
+    rows = {name: len(array) for name, array in template.items()}
+    outputs = {name: open_memmap(scene_path(prefix, name), mode='w+', dtype=dtype,
+                                 shape=(rows[name] * size ** 3,) + template[name].shape[1:])
+               for name, dtype in SCENE_ARRAYS.items()}
+    for first, bases in cube_chunks(size, spacing, cube_size, chunk_cubes):
+        for name, array in mesh_chunk(first, bases, cube_size).items():
+            outputs[name][rows[name] * first:rows[name] * (first + len(bases))] = array
+    for output in outputs.values():
+        output.flush()
+
+
+def save_voxel_scene_data(prefix, scene, greedy=True):
+    # Scena indeksowana ze scian siatki voxeli (VoxelScene.faces) - te same pliki, co save_scene_data,
+    # wiec widok BSP wczytuje ja bez zmian. Rogi scian zespawane we wspolne wierzcholki
+    vertices, corners, _ = weld_polygons(scene.faces(greedy))
+    arrays = {'vertices': vertices, 'faces': corners.reshape(-1, 4)}
+    for name, dtype in SCENE_ARRAYS.items():
+        np.save(scene_path(prefix, name), np.ascontiguousarray(arrays[name], dtype=dtype))
+
+
+def save_instance_data(prefix, size=3, spacing=1, cube_size=1.2):
+    save_instanced_scene(prefix, generate_cube_instances(size, spacing, cube_size))
+
+
+def generate_cube_instances(size=3, spacing=1, cube_size=1.2):
+    # Siatka jako jeden szescian-szablon i narozniki kopii - 3 liczby na szescian zamiast
+    # 8 wierzcholkow z krawedziami i scianami
+    return InstancedScene(CUBE_CORNERS * cube_size, CUBE_EDGES, CUBE_FACES,
+                          grid_bases(0, size ** 3, size, spacing, cube_size))
+
+
+def cube_grid_faces(size=3, spacing=1, cube_size=1.2):
+    # Sciany wszystkich szescianow jako tablica (F,4,3)
+    bases = grid_bases(0, size ** 3, size, spacing, cube_size)
+    return cube_corners(bases, cube_size)[:, CUBE_FACES].reshape(-1, 4, 3)
+
+
+def generate_voxel_grid(size=3, cube_size=1.2):
+    # Siatka stykajacych sie szescianow (spacing=0) jako zajetosc komorek - zamiast 6 * size^3 scian
+    # tylko widoczne sciany zewnetrzne, polaczone w prostokaty (VoxelScene.faces)
+    return VoxelScene(np.ones((size, size, size), dtype=bool), cube_size)
+
+
+def generate_cube_grid(size=3, spacing=1, cube_size=1.2):
+    # Sciany wszystkich szescianow jako listy krotek punktow
+    return [[tuple(point) for point in face] for face in cube_grid_faces(size, spacing, cube_size).tolist()]
+
+
+def cell_groups(keys):
+    # Numer grupy dla kazdego wiersza kluczy (N,3) - rowne wiersze, ta sama grupa
+    # Sortowanie po trzech kolumnach kluczy - szybsze niz np.unique(axis=0) na wierszach
+    order = np.lexsort(keys.T[::-1])
+    sorted_keys = keys[order]
+    new = np.ones(len(keys), dtype=bool)
+    new[1:] = np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+    groups = np.empty(len(keys), dtype=np.int64)
+    groups[order] = np.cumsum(new) - 1
+    return groups
+
+
+def weld_vertices(points, tolerance=1e-6):
+    # Punkty blizsze niz tolerance w kazdej osi -> jeden wierzcholek (lancuch takich punktow tez);
+    # punkty dalsze niz 2 * tolerance w ktorejs osi nigdy nie sa laczone bezposrednio
+    # Zwraca (unikalne wierzcholki, numer wierzcholka dla kazdego punktu)
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    if not len(points):
+        return points, np.empty(0, dtype=np.int64)
+    # Jedna siatka rozcielaby pary lezace tuz po dwoch stronach granicy komorki. Siatki o oczku
+    # 2 * tolerance przesuniete o 0 albo pol oczka w kazdej osi (8 wersji): para punktow blizszych
+    # niz tolerance w kazdej osi lezy w jednej komorce co najmniej jednej z nich
+    groups = [cell_groups(np.floor((points + np.array(shift) * tolerance) / (2 * tolerance)).astype(np.int64))
+              for shift in itertools.product((0, 1), repeat=3)]
+    # Spojne skladowe: kazdy punkt bierze najmniejszy numer punktu ze swoich komorek, az nic sie nie zmieni
+    labels = np.arange(len(points))
+    while True:
+        previous = labels
+        for group in groups:
+            smallest = np.full(group.max() + 1, len(points))
+            np.minimum.at(smallest, group, labels)
+            labels = smallest[group]
+        if np.array_equal(labels, previous):
+            break
+    # Wierzcholkiem jest pierwszy punkt skladowej; wierzcholki numerowane w kolejnosci wspolrzednych
+    first = np.flatnonzero(labels == np.arange(len(points)))
+    first = first[np.lexsort(points[first].T[::-1])]
+    numbers = np.empty(len(points), dtype=np.int64)
+    numbers[first] = np.arange(len(first))
+    return points[first], numbers[labels]
+
+
+def weld_polygons(polygons, tolerance=1e-6):
+    # Wielokaty jako indeksy do wspolnych wierzcholkow: (wierzcholki, indeksy wszystkich rogow, dlugosci)
+    # Tablica (P,k,3) przechodzi bez rozpakowywania na listy punktow
+    if isinstance(polygons, np.ndarray):
+        lengths = np.full(len(polygons), polygons.shape[1])
+        points = polygons
+    else:
+        lengths = np.array([len(polygon) for polygon in polygons])
+        points = [point for polygon in polygons for point in polygon]
+    vertices, corners = weld_vertices(points, tolerance)
+    return vertices, corners, lengths
+
+
+def polygon_edges(corners, lengths):
+    # Unikalne krawedzie (E,2) jako pary indeksow i < j - kazdy rog z nastepnym w swoim wielokacie
+    next_corner = np.arange(1, len(corners) + 1)
+    ends = np.cumsum(lengths)
+    next_corner[ends - 1] = ends - lengths
+    first = np.minimum(corners, corners[next_corner])
+    second = np.maximum(corners, corners[next_corner])
+    # Para jako jedna liczba i * V + j - unique na liczbach zamiast na wierszach
+    vertex_count = int(corners.max()) + 1 if len(corners) else 0
+    keys = np.unique(first * vertex_count + second)
+    return np.stack((keys // vertex_count, keys % vertex_count), axis=1)
+
+
+def generate_edges_from_polygons(polygons, tolerance=1e-6):
+    # Krawedzie na indeksach zespawanych wierzcholkow - zwraca (wierzcholki (V,3), krawedzie (E,2))
+    vertices, corners, lengths = weld_polygons(polygons, tolerance)
+    return vertices, polygon_edges(corners, lengths)
+
+
+def save_both_formats(filename_polygons, filename_edges, size=3, spacing=1, cube_size=1.2):
+    # Wielokaty i krawedzie z jednej zespawanej siatki - siatka budowana tylko raz
+    vertices, corners, lengths = weld_polygons(cube_grid_faces(size, spacing, cube_size))
+    # Wszystkie sciany szescianow maja po 4 rogi
+    write_json_chunks(filename_polygons, [vertices[corners.reshape(-1, 4)]])
+    write_json_chunks(filename_edges, [vertices[polygon_edges(corners, lengths)]])
 
 
 if __name__ == "__main__":
-    save_cube_data("cube_polygons.json")
-
-    edges_polygons = generate_edges_from_polygons(generate_cube_grid())
-
-    serializable_edges = []
-    for edge in edges_polygons:
-        serializable_edges.append([
-            [float(coord) for coord in edge[0]],
-            [float(coord) for coord in edge[1]]
-        ])
-
-    with open("cube_data.json", 'w') as f:
-        json.dump(serializable_edges, f)
+    # python generate_cubes.py voxels - drzewo BSP ze scalonych scian siatki stykajacych sie
+    # szescianow zamiast ze wszystkich scian osobnych szescianow
+    if sys.argv[1:] == ["voxels"]:
+        save_voxel_scene_data("cube_scene", generate_voxel_grid())
+    else:
+        save_scene_data("cube_scene")
+    save_instance_data("cube_instances")
+    save_both_formats("cube_polygons.json", "cube_data.json")
@@ -0,0 +1,139 @@
+import numpy as np
+
+from framebuffer import FrameBuffer
+from spatial_index import gather_ranges
+
+# Najwiecej kandydatow na piksele w jednej paczce trojkatow - ogranicza pamiec na duze trojkaty
+PIXEL_BATCH = 1 << 20
+
+
+def fan_triangles(starts, lengths):
+    # Wielokaty wypukle jako wachlarze trojkatow: (T,3) indeksy wierzcholkow i (T,) numer wielokata
+    counts = np.maximum(lengths - 2, 0)
+    owners = np.repeat(np.arange(len(lengths)), counts)
+    first = np.cumsum(counts) - counts
+    step = np.arange(len(owners)) - np.repeat(first, counts)
+    corner = starts[owners]
+    return np.stack((corner, corner + step + 1, corner + step + 2), axis=1), owners
+
+
+class ZBufferRenderer(FrameBuffer):
+    # Programowy rasterizer z buforem glebokosci - rysuje do tablic numpy, bez Tk.
+    # Wszystkie trojkaty ramki rasteryzowane razem: kazdy trojkat rozwijany do przedzialow pikseli
+    # w kolejnych wierszach, test glebokosci dla wszystkich pikseli naraz
+    def __init__(self, width=800, height=600, background=(255, 255, 255)):
+        self.depth = np.empty((height, width))
+        super().__init__(width, height, background)
+
+    def clear(self):
+        super().clear()
+        self.depth[:] = np.inf
+
+    def draw_polygons_in_order(self, screen, starts, lengths, colors):
+        # Algorytm malarza (np. kolejnosc z BSP): kazdy nastepny wielokat zaslania poprzednie.
+        # Zamiast glebokosci sztuczna odleglosc malejaca z kolejnoscia - ten sam test glebokosci
+        # rozstrzyga wtedy o kolejnosci, wiec wszystkie wielokaty nadal ida jedna paczka
+        starts = np.asarray(starts)
+        lengths = np.asarray(lengths)
+        vertex_ids = gather_ranges(starts, starts + lengths)
+        order_depth = np.repeat(len(starts) - np.arange(len(starts)), lengths).astype(float)
+        self.depth[:] = np.inf
+        self.draw_polygons(screen[vertex_ids], order_depth, np.cumsum(lengths) - lengths, lengths, colors)
+
+    def draw_squares(self, screen, sides, depth, colors):
+        # Wypelnione kwadraty o boku sides pikseli (malych - kazdy piksel osobno) wokol punktow screen,
+        # w stalej glebokosci - najdalszy poziom szczegolowosci
+        sides = np.maximum(sides, 1)
+        counts = sides * sides
+        owners = np.repeat(np.arange(len(sides)), counts)
+        local = np.arange(len(owners)) - np.repeat(np.cumsum(counts) - counts, counts)
+        corner = np.rint(screen - (sides[:, None] - 1) / 2).astype(np.int64)
+        px = corner[owners, 0] + local % sides[owners]
+        py = corner[owners, 1] + local // sides[owners]
+        inside = (px >= 0) & (px < self.width) & (py >= 0) & (py < self.height)
+        owners = owners[inside]
+        pixel = py[inside] * self.width + px[inside]
+        z = depth[owners]
+
+        buffer = self.depth.reshape(-1)
+        np.minimum.at(buffer, pixel, z)
+        nearest = z == buffer[pixel]
+        self.color.reshape(-1, 3)[pixel[nearest]] = colors[owners[nearest]]
+
+    def draw_polygons(self, screen, depth, starts, lengths, colors):
+        # screen (V,2) wspolrzedne ekranu, depth (V,) glebokosc wzdluz osi kamery (> 0),
+        # wielokat i to wierzcholki [starts[i], starts[i] + lengths[i]), colors (P,3) uint8
+        triangles, owners = fan_triangles(np.asarray(starts), np.asarray(lengths))
+        if not len(triangles):
+            return
+        xy = screen[triangles]  # (T,3,2)
+        x0, y0 = xy[:, 0, 0], xy[:, 0, 1]
+        x1, y1 = xy[:, 1, 0], xy[:, 1, 1]
+        x2, y2 = xy[:, 2, 0], xy[:, 2, 1]
+        area = (x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0)
+
+        # Prostokaty pikseli trojkatow przyciete do ekranu; zdegenerowane i poza ekranem odpadaja
+        low = np.maximum(np.ceil(xy.min(axis=1)), 0).astype(np.int64)
+        high = np.minimum(np.floor(xy.max(axis=1)), (self.width - 1, self.height - 1)).astype(np.int64)
+        size = np.maximum(high - low + 1, 0)
+        pixels = size[:, 0] * size[:, 1]
+        keep = np.flatnonzero((pixels > 0) & (np.abs(area) > 1e-12))
+        if not len(keep):
+            return
+
+        # Wspolrzedne barycentryczne i 1/z jako funkcje liniowe ekranu: a * x + b * y + c
+        # (1/z, a nie z, interpoluje sie liniowo po rzucie perspektywicznym)
+        inverse = 1.0 / area
+        bary = np.empty((len(triangles), 3, 3))
+        for k, ((ax, ay), (bx, by)) in enumerate((((x1, y1), (x2, y2)), ((x2, y2), (x0, y0)),
+                                                  ((x0, y0), (x1, y1)))):
+            bary[:, k, 0] = (ay - by) * inverse
+            bary[:, k, 1] = (bx - ax) * inverse
+            bary[:, k, 2] = (ax * by - bx * ay) * inverse
+        inverse_depth = np.einsum('tk,tkj->tj', 1.0 / depth[triangles], bary)
+
+        # Paczki kolejnych trojkatow o lacznie najwyzej PIXEL_BATCH pikselach (duzy trojkat - sam)
+        totals = np.cumsum(pixels[keep])
+        begin = 0
+        while begin < len(keep):
+            base = totals[begin - 1] if begin else 0
+            end = max(begin + 1, int(np.searchsorted(totals, base + PIXEL_BATCH, side='right')))
+            batch = keep[begin:end]
+            self.fill(batch, low, high, bary, inverse_depth, colors[owners[batch]])
+            begin = end
+
+    def fill(self, batch, low, high, bary, inverse_depth, colors):
+        # Rasteryzacja liniami: dla kazdego trojkata i wiersza ekranu przedzial x, w ktorym wszystkie
+        # trzy wspolrzedne barycentryczne sa nieujemne - potem tylko piksele z tych przedzialow
+        rows = high[batch, 1] - low[batch, 1] + 1
+        row_tri = np.repeat(np.arange(len(batch)), rows)
+        ids = batch[row_tri]
+        y = low[ids, 1] + np.arange(len(row_tri)) - np.repeat(np.cumsum(rows) - rows, rows)
+
+        # w_k = a_k * x + (b_k * y + c_k) >= 0 - przy a_k > 0 ogranicza x z lewej, przy a_k < 0 z prawej
+        slope = bary[ids, :, 0]
+        rest = bary[ids, :, 1] * y[:, None] + bary[ids, :, 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bound = -rest / slope
+        left = np.where(slope > 0, bound, -np.inf).max(axis=1)
+        right = np.where(slope < 0, bound, np.inf).min(axis=1)
+        # Krawedz rownolegla do wiersza - caly wiersz po zlej stronie albo nic
+        blocked = np.any((slope == 0) & (rest < -1e-9), axis=1)
+        start = np.maximum(np.ceil(left - 1e-9), low[ids, 0])
+        end = np.minimum(np.floor(right + 1e-9), high[ids, 0])
+        lengths = np.where(blocked, 0, np.maximum(end - start + 1, 0)).astype(np.int64)
+
+        span = np.repeat(np.arange(len(lengths)), lengths)
+        px = start.astype(np.int64)[span] + np.arange(len(span)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        py = y[span]
+        tri = row_tri[span]
+        pixel_ids = ids[span]
+        z = 1.0 / (inverse_depth[pixel_ids, 0] * px + inverse_depth[pixel_ids, 1] * py + inverse_depth[pixel_ids, 2])
+
+        # Test glebokosci: minimum po wszystkich kandydatach piksela (razem z tym, co juz jest w buforze),
+        # kolor biora kandydaci, ktorzy to minimum wyznaczyli
+        pixel = py * self.width + px
+        depth = self.depth.reshape(-1)
+        np.minimum.at(depth, pixel, z)
+        nearest = z == depth[pixel]
+        self.color.reshape(-1, 3)[pixel[nearest]] = colors[tri[nearest]]
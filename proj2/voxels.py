@@ -0,0 +1,75 @@
+import numpy as np
+
+
+class VoxelScene:
+    # Scena z siatki zajetosci (X,Y,Z) bool - komorka [i,j,k] to szescian o boku cell_size
+    # w origin + (i,j,k) * cell_size. Sasiednie komorki stykaja sie scianami, wiec sciana
+    # miedzy dwiema zajetymi komorkami nigdy nie jest widoczna i nie jest generowana
+    def __init__(self, occupancy, cell_size=1.0, origin=(0.0, 0.0, 0.0)):
+        self.occupancy = np.asarray(occupancy, dtype=bool)
+        self.cell_size = cell_size
+        self.origin = np.asarray(origin, dtype=float)
+
+    def exposed(self, axis, side):
+        # Zajete komorki, ktorych sciana od strony side (+1/-1) osi axis graniczy z pusta komorka
+        # albo z brzegiem siatki. Wynik w osiach (axis, u, v), u = axis + 1, v = axis + 2 (mod 3)
+        occupancy = np.transpose(self.occupancy, (axis, (axis + 1) % 3, (axis + 2) % 3))
+        neighbor = np.zeros_like(occupancy)
+        if side > 0:
+            neighbor[:-1] = occupancy[1:]
+        else:
+            neighbor[1:] = occupancy[:-1]
+        return occupancy & ~neighbor
+
+    def faces(self, greedy=True):
+        # Widoczne sciany jako czworokaty (F,4,3) z normalna na zewnatrz (jak CUBE_FACES).
+        # greedy=True - sasiednie sciany w jednej plaszczyznie laczone w wieksze prostokaty
+        quads = []
+        for axis in range(3):
+            for side in (-1, 1):
+                mask = self.exposed(axis, side)
+                rectangles = merge_rectangles(mask) if greedy else unit_rectangles(mask)
+                quads.append(self.rectangle_quads(axis, side, *rectangles))
+        return np.concatenate(quads)
+
+    def rectangle_quads(self, axis, side, layer, u, v, width, height):
+        # Prostokaty w osiach (axis, u, v) na rogi w ukladzie sceny. e_u x e_v = e_axis, wiec
+        # rogi (u,v), (u+w,v), (u+w,v+h), (u,v+h) daja normalna +axis - dla side < 0 odwrotnie
+        corners = np.empty((len(layer), 4, 3))
+        corners[:, :, 0] = (layer + (side > 0))[:, None]
+        corners[:, :, 1] = np.stack((u, u + width, u + width, u), axis=1)
+        corners[:, :, 2] = np.stack((v, v, v + height, v + height), axis=1)
+        if side < 0:
+            corners = corners[:, ::-1]
+        # z osi (axis, u, v) z powrotem do (x, y, z)
+        corners = np.roll(corners, axis, axis=2)
+        return corners * self.cell_size + self.origin
+
+
+def unit_rectangles(mask):
+    # Kazda widoczna sciana osobno - prostokaty 1x1
+    layer, u, v = np.nonzero(mask)
+    ones = np.ones(len(layer), dtype=np.int64)
+    return layer, u, v, ones, ones
+
+
+def merge_rectangles(mask):
+    # Laczenie zachlanne scian jednej warstwy, wszystkie warstwy naraz:
+    # 1. w kazdym wierszu u ciagi zajetych komorek wzdluz v -> odcinki [v0, v1)
+    # 2. odcinki o tych samych (warstwa, v0, v1) w kolejnych wierszach u -> jeden prostokat
+    # Wynik: (warstwa, u, v, szerokosc wzdluz u, wysokosc wzdluz v)
+    padded = np.zeros(mask.shape[:2] + (mask.shape[2] + 2,), dtype=np.int8)
+    padded[:, :, 1:-1] = mask
+    change = np.diff(padded, axis=2)
+    # nonzero idzie w kolejnosci wierszy, wiec i-ty poczatek pasuje do i-tego konca
+    layer, u, v_start = np.nonzero(change == 1)
+    v_end = np.nonzero(change == -1)[2]
+
+    order = np.lexsort((u, v_end, v_start, layer))
+    layer, u, v_start, v_end = layer[order], u[order], v_start[order], v_end[order]
+    new = np.ones(len(layer), dtype=bool)
+    new[1:] = ((layer[1:] != layer[:-1]) | (v_start[1:] != v_start[:-1]) | (v_end[1:] != v_end[:-1])
+               | (u[1:] != u[:-1] + 1))
+    first = np.flatnonzero(new)
+    width = np.diff(np.append(first, len(layer)))
+    return layer[first], u[first], v_start[first], width, v_end[first] - v_start[first]